@@ -0,0 +1,379 @@
+# stdlib
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+# third-party
+import numpy
+# local
+import dataset
+import regression as rg
+import resultset
+import scaler
+import spambase
+
+
+INDENT = '  '
+ROWS = 4601 # as many as spambase.data
+COLUMNS = 57 # feature columns, as in spambase.data
+REPEAT = 5
+THRESHOLD = 0.1 # slowdown, as a fraction, which counts as a regression
+
+
+###############################################################################
+#
+# Synthetic data shaped like spambase.data: mostly-zero word and character
+# frequencies in [0,100], then the three capital run length columns, then a
+# 0/1 label with spam about 40% of the time. Spam uses some of the words
+# more often than not-spam does, so learners have something to find and
+# the ROC curves are not all on the diagonal.
+#
+###############################################################################
+
+
+def dataformat(columns=COLUMNS):
+    '''Return a data format list like spambase.dataformat with the given
+    number of feature columns, at least 3.
+    '''
+    if columns < 3:
+        raise ValueError('need at least 3 feature columns, not {}'.format(
+            columns))
+    return (columns - 3) * spambase.dataformat[:1] + spambase.dataformat[-4:]
+
+
+def generate(rows=ROWS, columns=COLUMNS, seed=rg.RANDOMSEED):
+    '''Generate rows of values valid for dataformat(columns), the same way
+    each time. Return a 2-D array with the label in the final column.
+    '''
+    rs = numpy.random.RandomState(seed)
+    values = numpy.zeros((rows, columns + 1))
+    labels = (rs.random_sample(rows) < 0.4).astype(numpy.float64)
+    # frequencies: zero mostly, more often nonzero in spam for half the words
+    freqs = columns - 3
+    present = rs.random_sample((rows, freqs)) < 0.2
+    present[:, ::2] |= (rs.random_sample((rows, (freqs + 1) // 2)) < 0.3) & \
+                       (labels[:, numpy.newaxis] == spambase.SPAM)
+    amounts = numpy.minimum(rs.exponential(0.5, (rows, freqs)), 100.0)
+    values[:, :freqs] = numpy.round(present * amounts, 2)
+    # capital runs: average >= 1, longest >= 1, total >= longest
+    longest = numpy.floor(rs.pareto(1.5, rows) * 10) + 1
+    values[:, freqs] = numpy.round(1 + rs.random_sample(rows) *
+                                   (longest - 1), 3)
+    values[:, freqs + 1] = longest
+    values[:, freqs + 2] = longest + numpy.floor(rs.exponential(200.0, rows))
+    values[:, -1] = labels
+    return values
+
+
+def writedata(path, values):
+    '''Write generated values to path in spambase.data's text format.'''
+    columns = values.shape[1] - 1
+    fmt = (columns - 3) * ['%.2f'] + ['%.3f', '%d', '%d', '%d']
+    numpy.savetxt(path, values, fmt=fmt, delimiter=',')
+
+
+###############################################################################
+#
+# Each benchmark is a function which takes the synthetic data file, its line
+# count and its data format, does any setup which should not be timed, and
+# returns a function of no arguments to time. Every call to that function
+# must do the same amount of work.
+#
+###############################################################################
+
+
+def loaded(dfile, linect, dformat):
+    '''Load the synthetic data, quietly.'''
+    return dataset.loadfile(dfile, linect, dformat, bulk=True,
+                            showprogress=False)
+
+
+def preprocessed(dfile, linect, dformat):
+    '''Load and preprocess the synthetic data, as regression.py would.'''
+    data = loaded(dfile, linect, dformat)
+    rg.preprocess(data)
+    return data
+
+
+def sparse(dfile, linect, dformat):
+    '''Load and preprocess the synthetic data as a SparseDataMatrix.'''
+    data = dataset.loadfile(dfile, linect, dformat, bulk=True,
+                            showprogress=False, sparse=True)
+    rg.preprocess(data)
+    return data
+
+
+def results(dfile, linect, dformat):
+    '''Score the synthetic data with fixed weights. Return DataResults.'''
+    data = preprocessed(dfile, linect, dformat)
+    weights = numpy.random.RandomState(rg.RANDOMSEED).normal(size=data.width)
+    scores = rg.Regression.model(weights, data.features)
+    return [resultset.DataResult(label, score) \
+            for label, score in zip(data.labels.tolist(), scores.tolist())]
+
+
+def bench_loadfile_text(dfile, linect, dformat):
+    return lambda: dataset.loadfile(dfile, linect, dformat,
+                                    showprogress=False)
+
+
+def bench_loadfile_bulk(dfile, linect, dformat):
+    return lambda: loaded(dfile, linect, dformat)
+
+
+def bench_loadfile_cache(dfile, linect, dformat):
+    cache = dfile + '.cache'
+    dataset.loadfile(dfile, linect, dformat, bulk=True, cache=cache,
+                     showprogress=False)
+    # touch every page, since the cache is only mapped until then
+    return lambda: float(dataset.loadfile(dfile, linect, dformat, bulk=True,
+                                          cache=cache).features.sum())
+
+
+def bench_applykernel(dfile, linect, dformat):
+    data = loaded(dfile, linect, dformat)
+    # the same z-score as regression.preprocess; repeats see z-scores
+    def kernel(column):
+        return (column - column.mean()) / column.std(ddof=1)
+    return lambda: dataset.applykernel(data, kernel)
+
+
+def bench_scaler(dfile, linect, dformat):
+    data = loaded(dfile, linect, dformat)
+    return lambda: scaler.Scaler.fit(data).transform(data.features)
+
+
+def bench_stochastic_pass(dfile, linect, dformat):
+    data = preprocessed(dfile, linect, dformat)
+    weights = data.width * [0.0]
+    return lambda: rg.GradientDescent.stochastic_pass(
+        weights, data, rg.Regression.model, rg.Regression.gradient, 0.0001)
+
+
+def bench_batch(dfile, linect, dformat):
+    data = preprocessed(dfile, linect, dformat)
+    weights = data.width * [0.0]
+    return lambda: rg.GradientDescent.batch(
+        weights, data, rg.Regression.model, rg.Regression.gradient, 0.0001)
+
+
+def bench_stochastic_sparse(dfile, linect, dformat):
+    data = sparse(dfile, linect, dformat)
+    weights = data.width * [0.0]
+    return lambda: rg.GradientDescent.stochastic_pass(
+        weights, data, rg.Regression.model, rg.Regression.gradient, 0.0001)
+
+
+def bench_batch_sparse(dfile, linect, dformat):
+    data = sparse(dfile, linect, dformat)
+    weights = data.width * [0.0]
+    return lambda: rg.GradientDescent.batch(
+        weights, data, rg.Regression.model, rg.Regression.gradient, 0.0001)
+
+
+def bench_leastsquares(dfile, linect, dformat):
+    data = preprocessed(dfile, linect, dformat)
+    return lambda: rg.LeastSquares.solve(data)
+
+
+def bench_rocdata(dfile, linect, dformat):
+    rs = results(dfile, linect, dformat)
+    return lambda: resultset.rocdata(rs)
+
+
+def bench_minerrop(dfile, linect, dformat):
+    rs = results(dfile, linect, dformat)
+    return lambda: resultset.minerrop(rs)
+
+
+def bench_auc(dfile, linect, dformat):
+    roc = resultset.rocdata(results(dfile, linect, dformat))
+    return lambda: resultset.auc(roc)
+
+
+# name, benchmark; in the order they run
+BENCHMARKS = [('loadfile-text', bench_loadfile_text),
+              ('loadfile-bulk', bench_loadfile_bulk),
+              ('loadfile-cache', bench_loadfile_cache),
+              ('applykernel', bench_applykernel),
+              ('scaler', bench_scaler),
+              ('stochastic_pass', bench_stochastic_pass),
+              ('batch', bench_batch),
+              ('stochastic_pass-sparse', bench_stochastic_sparse),
+              ('batch-sparse', bench_batch_sparse),
+              ('leastsquares', bench_leastsquares),
+              ('rocdata', bench_rocdata),
+              ('minerrop', bench_minerrop),
+              ('auc', bench_auc)]
+
+
+###############################################################################
+
+
+def maxrss():
+    '''Return the peak resident memory of this process so far, in KiB.'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def runbenchmark(task):
+    '''Run one benchmark in a worker process of its own. Return a dict.
+
+    task -- tuple of the benchmark's index in BENCHMARKS, the data file, its
+            line count, its number of feature columns and the repeat count
+
+    Peak memory is the process's, so a fresh process per benchmark keeps
+    one benchmark's peak from hiding the next one's. The peak while timing,
+    beyond the peak reached during setup, is reported as runpeak; it is 0
+    when the timed calls fit in memory freed after setup.
+
+    '''
+    i, dfile, linect, columns, repeat = task
+    name, benchmark = BENCHMARKS[i]
+    stdout = sys.stdout
+    # loadfile announces every load
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        fn = benchmark(dfile, linect, dataformat(columns))
+        setuppeak = maxrss()
+        times = []
+        for r in xrange(repeat):
+            start = timeit.default_timer()
+            fn()
+            times.append(timeit.default_timer() - start)
+        peak = maxrss()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    times.sort()
+    return {'name':name,
+            'times':times,
+            'best':times[0],
+            'median':times[len(times) // 2],
+            'setuppeak':setuppeak,
+            'peak':peak,
+            'runpeak':peak - setuppeak}
+
+
+def revision():
+    '''Return the git revision of this code, or None if it is unknown.'''
+    try:
+        with open(os.devnull, 'w') as null:
+            return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], stderr=null,
+                cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(rows=ROWS, columns=COLUMNS, repeat=REPEAT, names=None):
+    '''Run benchmarks on freshly generated data. Return a report dict.
+
+    rows    -- number of synthetic lines
+    columns -- number of synthetic feature columns
+    repeat  -- number of timed calls per benchmark; the best is compared
+    names   -- benchmark names to run, or None for all of BENCHMARKS
+
+    '''
+    tasks = [i for i, (name, benchmark) in enumerate(BENCHMARKS) \
+             if names is None or name in names]
+    tmpdir = tempfile.mkdtemp(prefix='benchmark')
+    try:
+        dfile = os.path.join(tmpdir, 'synthetic.data')
+        writedata(dfile, generate(rows, columns))
+        report = {'revision':revision(),
+                  'python':platform.python_version(),
+                  'numpy':numpy.__version__,
+                  'rows':rows,
+                  'columns':columns,
+                  'repeat':repeat,
+                  'results':{}}
+        # one process per benchmark; see runbenchmark
+        pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        try:
+            for result in pool.imap(runbenchmark,
+                                    [(i, dfile, rows, columns, repeat) \
+                                     for i in tasks]):
+                name = result.pop('name')
+                report['results'][name] = result
+                print INDENT + '{}: best {:.6f}s, median {:.6f}s, ' \
+                      'peak {} KiB'.format(name, result['best'],
+                                           result['median'], result['peak'])
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        shutil.rmtree(tmpdir)
+    return report
+
+
+def compare(old, new, threshold=THRESHOLD):
+    '''Compare two reports from run. Return a list of (name, old best time,
+    new best time, ratio, regressed) tuples, one per benchmark in both.
+
+    A benchmark has regressed when its best time grew by more than the
+    threshold fraction of the old one.
+
+    '''
+    comparison = []
+    for name, benchmark in BENCHMARKS:
+        if name in old['results'] and name in new['results']:
+            before = old['results'][name]['best']
+            after = new['results'][name]['best']
+            ratio = after / before if before else float('inf')
+            comparison.append((name, before, after, ratio,
+                               ratio > 1 + threshold))
+    return comparison
+
+
+###############################################################################
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Time and measure the memory of the slow parts of '
+                    'loading, training and evaluation on synthetic data.')
+    parser.add_argument('--rows', type=int, default=ROWS)
+    parser.add_argument('--columns', type=int, default=COLUMNS)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--only', nargs='+', metavar='NAME',
+                        choices=[name for name, benchmark in BENCHMARKS],
+                        help='benchmarks to run; all by default')
+    parser.add_argument('--output', metavar='FILE',
+                        help='write the report to FILE as JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two reports instead of running; exit '
+                             'with status 1 if any benchmark regressed')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path, mode='rb') as fd:
+                reports.append(json.load(fd))
+        regressed = False
+        for name, before, after, ratio, worse in compare(
+                reports[0], reports[1], args.threshold):
+            print '{}{}: {:.6f}s -> {:.6f}s ({:.2f}x){}'.format(
+                INDENT, name, before, after, ratio,
+                ' REGRESSED' if worse else '')
+            regressed = regressed or worse
+        sys.exit(1 if regressed else 0)
+
+    print 'Benchmarking {} rows of {} columns, best of {}'.format(
+        args.rows, args.columns, args.repeat)
+    report = run(args.rows, args.columns, args.repeat, args.only)
+    if args.output:
+        with open(args.output, mode='wb') as fd:
+            json.dump(report, fd, indent=2, sort_keys=True)
+            fd.write('\n')
+
+
+###############################################################################
@@ -0,0 +1,77 @@
+# stdlib
+import os
+# third-party
+import numpy
+
+
+###############################################################################
+
+
+def save(path, **arrays):
+    '''Save named arrays to path in NumPy's compressed .npz format.
+
+    The file is written under a temporary name and then renamed, so an
+    interrupted save leaves any previous file at path intact.
+
+    '''
+    partial = path + '.partial'
+    with open(partial, mode='wb') as fd:
+        numpy.savez_compressed(fd, **arrays)
+    os.rename(partial, path)
+
+
+def load(path):
+    '''Load the named arrays saved to path. Return a dict.'''
+    with numpy.load(path) as npz:
+        return dict((name, npz[name]) for name in npz.files)
+
+
+###############################################################################
+
+
+class Checkpoint(object):
+    '''The state of a gradient descent loop between passes.'''
+
+    def __init__(self, weights, learningrate, errors, passes, rngstate,
+                 finished=False):
+        self.weights = weights # accepted so far
+        self.learningrate = learningrate # for the next pass
+        self.errors = errors # training RMSE after each pass, initial first
+        self.passes = passes # made so far, accepted or not
+        self.rngstate = rngstate # from getstate of the loop's random source
+        self.finished = finished # whether learning has finished
+
+    def save(self, path):
+        '''Save the checkpoint to path, atomically.'''
+        version, internal, gauss = self.rngstate
+        save(path,
+             weights=numpy.array(self.weights, dtype=numpy.float64),
+             learningrate=numpy.float64(self.learningrate),
+             errors=numpy.array(self.errors, dtype=numpy.float64),
+             passes=numpy.int64(self.passes),
+             finished=numpy.bool_(self.finished),
+             rngversion=numpy.int64(version),
+             rnginternal=numpy.array(internal, dtype=numpy.int64),
+             rnggauss=numpy.float64(numpy.nan if gauss is None else gauss))
+
+    @classmethod
+    def load(cls, path):
+        '''Load a checkpoint saved to path.'''
+        arrays = load(path)
+        gauss = arrays['rnggauss'].item()
+        return cls(arrays['weights'].tolist(),
+                   arrays['learningrate'].item(),
+                   arrays['errors'].tolist(),
+                   arrays['passes'].item(),
+                   (arrays['rngversion'].item(),
+                    tuple(arrays['rnginternal'].tolist()),
+                    None if numpy.isnan(gauss) else gauss),
+                   arrays['finished'].item())
+
+    def __repr__(self):
+        return '{}({} passes, error {}, learning rate {}{})'.format(
+            self.__class__.__name__, self.passes, self.errors[-1],
+            self.learningrate, ', finished' if self.finished else '')
+
+
+###############################################################################
@@ -0,0 +1,131 @@
+# stdlib
+import ctypes
+import multiprocessing
+from multiprocessing import sharedctypes
+# third-party
+import numpy
+# local
+import dataset
+import regression as rg
+import spambase
+import stats
+import telemetry
+
+
+INDENT = '  '
+
+
+###############################################################################
+
+
+def share(array):
+    '''Copy an array into shared memory. Return an array backed by it.
+
+    Worker processes started afterwards see the same memory, so the array is
+    never copied or pickled per task.
+
+    '''
+    raw = sharedctypes.RawArray(ctypes.c_char, array.nbytes)
+    shared = numpy.frombuffer(raw, dtype=array.dtype).reshape(array.shape)
+    shared[:] = array
+    return shared
+
+
+# set in each worker process by initworker
+workerdata = None
+workerfolds = None
+workerlearners = None
+
+
+def initworker(data, folds, learners):
+    '''Give a worker process the data to cross-validate.'''
+    global workerdata, workerfolds, workerlearners
+    workerdata = data
+    workerfolds = folds
+    workerlearners = learners
+
+
+def runtask(task):
+    '''Train and test one learner on one fold in a worker process.
+    Return a tuple of the fold, the learner's index, testing RMSE and AUC.
+    '''
+    k, i = task
+    regression, gdfunction, learningrate = workerlearners[i]
+    testing, training = rg.holdout(workerfolds, k)
+    # the printed training events of many workers would interleave badly
+    weights = rg.learn(gdfunction, workerdata[training], regression,
+                       learningrate, callback=telemetry.quiet)
+    terror, roc, auc = rg.evaluate(weights, workerdata[testing], regression)
+    return k, i, terror, auc
+
+
+###############################################################################
+
+
+def learnername(learner):
+    '''Name a (regression, gdfunction, learning rate) learner.'''
+    regression, gdfunction, learningrate = learner
+    return '{}-{}_lambda={}'.format(regression.__name__, gdfunction.__name__,
+                                    rg.learningrates(learningrate)[2]).lower()
+
+
+def crossvalidate(data, learners, processes=None):
+    '''Train and test every learner on every fold in a pool of processes.
+    Return a list with, per learner, a list of (testing RMSE, AUC) per fold.
+
+    data      -- DataMatrix, already preprocessed
+    learners  -- list of (regression, gdfunction, learning rate) tuples
+                 eg: regression.LEARNERS
+    processes -- number of worker processes; defaults to the cpu count
+
+    The data is copied into shared memory once, before the workers start,
+    and each task names only a fold and a learner.
+
+    '''
+    shared = dataset.DataMatrix(share(data.features), share(data.labels))
+    folds = rg.folds(len(data))
+    tasks = [(k, i) for i in xrange(len(learners)) for k in xrange(len(folds))]
+    results = [len(folds) * [None] for learner in learners]
+    pool = multiprocessing.Pool(processes, initworker,
+                                (shared, folds, learners))
+    try:
+        for k, i, terror, auc in pool.imap_unordered(runtask, tasks):
+            results[i][k] = (terror, auc)
+            print INDENT + '{} fold {}: RMSE {}, AUC {}'.format(
+                learnername(learners[i]), k + 1, terror, auc)
+    finally:
+        pool.terminate()
+        pool.join()
+    return results
+
+
+def summarize(values):
+    '''Return the mean and standard deviation of a list of numbers.'''
+    mu = stats.mean(values)
+    return mu, stats.stddev(stats.mvue(values, mu))
+
+
+###############################################################################
+
+
+if __name__ == '__main__':
+    print
+
+    # load from file
+    spambase.load()
+    d = spambase.data
+    rg.preprocess(d)
+
+    print 'Folds:', rg.FOLDCOUNT
+    print 'Learners:', len(rg.LEARNERS)
+
+    # do every learner on every fold
+    results = crossvalidate(d, rg.LEARNERS)
+    for learner, folds in zip(rg.LEARNERS, results):
+        terrors, aucs = zip(*folds)
+        print '== {} =='.format(learnername(learner))
+        print INDENT + 'Testing RMSE: {} +/- {}'.format(*summarize(terrors))
+        print INDENT + 'AUC: {} +/- {}'.format(*summarize(aucs))
+
+
+###############################################################################
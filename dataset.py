@@ -1,7 +1,25 @@
+# stdlib
+import hashlib
+import itertools
+import os
+import struct
+import warnings
+# third-party
+import numpy
 # local
 import progress as pg
 
 
+CHUNKSIZE = 65536 # lines parsed at once by a bulk load
+
+# binary cache header:
+#   magic, dformat fingerprint, source mtime, source size, source hash,
+#   requested line count, row count, column count, label dtype
+CACHEMAGIC = 'DMC1'
+CACHEHEADER = struct.Struct('<4s20sdQ20sQQQ8s')
+CACHEALIGN = 64 # the arrays start at a multiple of this many bytes
+
+
 ###############################################################################
 
 
@@ -19,6 +37,288 @@ class DataPoint(object):
                                    self.label)
 
 
+class DataRow(object):
+    '''A DataPoint-like view of a single row of a DataMatrix.
+
+    Reading features gives a view into the matrix rather than a copy, and
+    assigning features writes the new values back into the matrix.
+
+    '''
+
+    __slots__ = ('matrix', 'index')
+
+    def __init__(self, matrix, index):
+        self.matrix = matrix
+        self.index = index
+
+    @property
+    def features(self):
+        return self.matrix.features[self.index]
+
+    @features.setter
+    def features(self, feature_value_vector):
+        self.matrix.features[self.index] = feature_value_vector
+
+    @property
+    def label(self):
+        return self.matrix.labels[self.index].item()
+
+    def __str__(self):
+        return '{} labeled {}'.format(self.features.tolist(), self.label)
+
+    def __repr__(self):
+        return '{}({}, {})'.format(self.__class__.__name__,
+                                   self.features.tolist(), self.label)
+
+
+class DataMatrix(object):
+    '''Labeled data stored column-wise as a feature matrix and a label vector.
+
+    Row i of features and entry i of labels make up one data point. Indexing
+    with an integer or iterating yields DataRow views so that per-row callers
+    still work; indexing with a slice or a sequence of row numbers yields a
+    new DataMatrix holding those rows.
+
+    '''
+
+    def __init__(self, feature_matrix, label_vector):
+        self.features = numpy.asarray(feature_matrix, dtype=numpy.float64)
+        self.labels = numpy.asarray(label_vector)
+
+    @classmethod
+    def fromdatapoints(cls, datapoints):
+        '''Build a DataMatrix from a list of DataPoint instances.'''
+        return cls([dp.features for dp in datapoints],
+                   [dp.label for dp in datapoints])
+
+    @property
+    def width(self):
+        '''The number of features in each row.'''
+        return self.features.shape[1]
+
+    def column(self, j):
+        '''Return a view of the values of feature j for all rows.'''
+        return self.features[:, j]
+
+    def prepend(self, value):
+        '''Insert a constant feature with value in front of every row.'''
+        features = numpy.empty((len(self), self.width + 1))
+        features[:, 0] = value
+        features[:, 1:] = self.features
+        self.features = features
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, long, numpy.integer)):
+            return DataRow(self, i)
+        return DataMatrix(self.features[i], self.labels[i])
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield DataRow(self, i)
+
+    def __repr__(self):
+        return '{}({}x{})'.format(self.__class__.__name__, len(self),
+                                  self.width)
+
+
+class SparseMatrix(object):
+    '''A matrix of mostly zeros stored in compressed sparse row (CSR) form.
+
+    Row i has the nonzero values data[indptr[i]:indptr[i + 1]], which are
+    in the columns indices[indptr[i]:indptr[i + 1]], in increasing order.
+    Only the nonzero values are stored, and products with vectors of
+    weights touch only them.
+
+    '''
+
+    def __init__(self, data, indices, indptr, width):
+        self.data = numpy.asarray(data, dtype=numpy.float64)
+        self.indices = numpy.asarray(indices, dtype=numpy.intp)
+        self.indptr = numpy.asarray(indptr, dtype=numpy.intp)
+        self.width = width
+        self.rowids = None # row of each value, made when first needed
+
+    @classmethod
+    def fromdense(cls, dense):
+        '''Build a SparseMatrix from the nonzero values of a 2-D array.'''
+        dense = numpy.asarray(dense, dtype=numpy.float64)
+        rows, columns = numpy.nonzero(dense)
+        indptr = numpy.zeros(len(dense) + 1, dtype=numpy.intp)
+        numpy.cumsum(numpy.bincount(rows, minlength=len(dense)),
+                     out=indptr[1:])
+        return cls(dense[rows, columns], columns, indptr, dense.shape[1])
+
+    @classmethod
+    def stack(cls, matrices):
+        '''Build a SparseMatrix from the rows of SparseMatrices of the same
+        width, one after another.
+        '''
+        indptr = [numpy.zeros(1, dtype=numpy.intp)]
+        for m in matrices:
+            indptr.append(m.indptr[1:] + indptr[-1][-1])
+        return cls(numpy.concatenate([m.data for m in matrices]),
+                   numpy.concatenate([m.indices for m in matrices]),
+                   numpy.concatenate(indptr), matrices[0].width)
+
+    @property
+    def shape(self):
+        return len(self), self.width
+
+    @property
+    def nnz(self):
+        '''The number of nonzero values.'''
+        return len(self.data)
+
+    def row(self, i):
+        '''Return views of the column numbers and values of row i.'''
+        start, stop = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:stop], self.data[start:stop]
+
+    def rows(self):
+        '''Return the row number of each nonzero value.'''
+        if self.rowids is None:
+            self.rowids = numpy.repeat(numpy.arange(len(self)),
+                                       numpy.diff(self.indptr))
+        return self.rowids
+
+    def dot(self, vector):
+        '''Multiply by a vector with one entry per column.'''
+        products = self.data * numpy.asarray(vector)[self.indices]
+        return numpy.bincount(self.rows(), weights=products,
+                              minlength=len(self))
+
+    def tdot(self, vector):
+        '''Multiply the transpose by a vector with one entry per row.'''
+        products = self.data * numpy.asarray(vector)[self.rows()]
+        return numpy.bincount(self.indices, weights=products,
+                              minlength=self.width)
+
+    def gram(self, factors):
+        '''Return the 2-D array X' F X, for this matrix X and the diagonal
+        matrix F of a factor per row; the Hessian of a regression given the
+        curvature of each row.
+
+        Each row adds the products of every pair of its nonzero values, so
+        the work is the sum of the squares of the rows' nonzero counts.
+
+        '''
+        lengths = numpy.diff(self.indptr)[self.rows()] # of each value's row
+        left = numpy.repeat(numpy.arange(self.nnz), lengths)
+        offsets = numpy.arange(len(left)) - numpy.repeat(
+            numpy.cumsum(lengths) - lengths, lengths)
+        right = numpy.repeat(self.indptr[self.rows()], lengths) + offsets
+        products = self.data[left] * self.data[right] * \
+                   numpy.asarray(factors)[self.rows()[left]]
+        cells = self.indices[left] * self.width + self.indices[right]
+        sums = numpy.bincount(cells, weights=products,
+                              minlength=self.width ** 2)
+        return sums.astype(numpy.float64).reshape(self.width, self.width)
+
+    def scale(self, factors):
+        '''Multiply every column by its factor *IN PLACE*.'''
+        self.data *= numpy.asarray(factors)[self.indices]
+
+    def prepend(self, value):
+        '''Return a new SparseMatrix with a constant column of value in front
+        of every row.
+        '''
+        count = len(self)
+        indptr = self.indptr + numpy.arange(count + 1)
+        data = numpy.empty(self.nnz + count)
+        indices = numpy.empty(self.nnz + count, dtype=numpy.intp)
+        first = numpy.zeros(len(data), dtype=bool)
+        first[indptr[:-1]] = True
+        data[first], indices[first] = value, 0
+        data[~first], indices[~first] = self.data, self.indices + 1
+        return SparseMatrix(data, indices, indptr, self.width + 1)
+
+    def copy(self):
+        '''Return a new SparseMatrix with a copy of the values, sharing the
+        structure, which is never changed in place.
+        '''
+        return SparseMatrix(self.data.copy(), self.indices, self.indptr,
+                            self.width)
+
+    def todense(self):
+        '''Return the matrix as a 2-D array.'''
+        dense = numpy.zeros(self.shape)
+        dense[self.rows(), self.indices] = self.data
+        return dense
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __getitem__(self, i):
+        '''Return row i as a 1-D array given an integer; otherwise, a new
+        SparseMatrix of the rows given by a slice or sequence of row numbers.
+        '''
+        if isinstance(i, (int, long, numpy.integer)):
+            indices, values = self.row(i)
+            dense = numpy.zeros(self.width)
+            dense[indices] = values
+            return dense
+        rows = numpy.arange(len(self))[i]
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        indptr = numpy.zeros(len(rows) + 1, dtype=numpy.intp)
+        numpy.cumsum(lengths, out=indptr[1:])
+        positions = numpy.repeat(starts - indptr[:-1], lengths) + \
+                    numpy.arange(indptr[-1])
+        return SparseMatrix(self.data[positions], self.indices[positions],
+                            indptr, self.width)
+
+    def __repr__(self):
+        return '{}({}x{}, {} nonzero)'.format(self.__class__.__name__,
+                                              len(self), self.width,
+                                              self.nnz)
+
+
+class SparseDataMatrix(DataMatrix):
+    '''Labeled data with its features in a SparseMatrix.
+
+    It can be used wherever a DataMatrix can be for training and scoring,
+    and is indexed the same way, but its feature values cannot be changed
+    through its DataRows or columns.
+
+    '''
+
+    def __init__(self, feature_matrix, label_vector):
+        self.features = feature_matrix
+        self.labels = numpy.asarray(label_vector)
+
+    @classmethod
+    def fromdense(cls, data):
+        '''Build a SparseDataMatrix from the nonzero features of a
+        DataMatrix.
+        '''
+        return cls(SparseMatrix.fromdense(data.features), data.labels)
+
+    @property
+    def width(self):
+        '''The number of features in each row.'''
+        return self.features.width
+
+    def column(self, j):
+        raise TypeError('sparse data has no column views')
+
+    def prepend(self, value):
+        '''Insert a constant feature with value in front of every row.'''
+        self.features = self.features.prepend(value)
+
+    def __getitem__(self, i):
+        if isinstance(i, (int, long, numpy.integer)):
+            return DataRow(self, i)
+        return SparseDataMatrix(self.features[i], self.labels[i])
+
+    def __repr__(self):
+        return '{}({}x{}, {} nonzero)'.format(self.__class__.__name__,
+                                              len(self), self.width,
+                                              self.features.nnz)
+
+
 ###############################################################################
 
 
@@ -29,12 +329,197 @@ def loadfeature(s, f):
     if checkvalue(d):
         return d
     else:
-        raise ValueError(d + ' fails value check in ' + f)
+        raise ValueError('{!r} fails value check'.format(d))
 
 
-def loadfile(dfile, linect, dformat):
+def loadlines(lines, first, dformat):
+    '''Load lines one value at a time according to dformat.
+    Return a list of lists of values, one per line.
+
+    lines -- list of strings
+    first -- line number of the first string, used in error messages
+
+    A line without exactly one value per dformat entry raises a ValueError.
+
+    '''
+    rows = []
+    for n, line in enumerate(lines, first):
+        row = []
+        raws = line.split(',')
+        if len(raws) != len(dformat):
+            raise ValueError('line {}: expected {} values, got {}'.format(
+                n, len(dformat), len(raws)))
+        for col, (raw, fmt) in enumerate(zip(raws, dformat), 1):
+            try:
+                row.append(loadfeature(raw.strip(), fmt))
+            except ValueError as err:
+                raise ValueError('line {}, column {}: {}'.format(n, col, err))
+        rows.append(row)
+    return rows
+
+
+def checkcolumn(column, f):
+    '''Check a whole column of values against a data format tuple.
+    Return an array which is false where a value is invalid.
+
+    The value check is first called on the whole column, which works for
+    checks written with array-friendly operators like & and |. Checks which
+    cannot take an array (eg: chained comparisons) are called per value.
+
+    An int or long column must also hold whole, finite numbers. Written as
+    eg: 5.0 or 1e3 they pass, though int would reject that text.
+
+    '''
+    changetype, checkvalue = f
+    if isinstance(changetype, type) and issubclass(changetype, (int, long)):
+        whole = numpy.isfinite(column)
+        whole[whole] = column[whole] == numpy.floor(column[whole])
+    else:
+        whole = numpy.ones(column.shape, dtype=bool)
+    try:
+        passed = numpy.asarray(checkvalue(column), dtype=bool)
+    except (ValueError, TypeError):
+        passed = None
+    if passed is None or passed.shape != column.shape:
+        # values which are not whole cannot be coerced to check them
+        passed = numpy.array([w and bool(checkvalue(changetype(v))) \
+                              for v, w in zip(column.tolist(),
+                                              whole.tolist())], dtype=bool)
+    return passed & whole
+
+
+def labeltype(dformat):
+    '''Return the NumPy dtype of the labels coerced by dformat, or None if
+    the label's coercer is not a numeric type (eg: a lambda).
+    '''
+    changetype = dformat[-1][0]
+    if not isinstance(changetype, type):
+        return None
+    try:
+        dtype = numpy.dtype(changetype)
+    except TypeError:
+        return None
+    return dtype if dtype.kind in 'biuf' else None
+
+
+def loadchunk(lines, first, dformat):
+    '''Load a chunk of lines at once according to dformat.
+    Return a 2-D array with one row per line and one column per value.
+
+    lines -- list of strings
+    first -- line number of the first string, used in error messages
+
+    The whole chunk is parsed by NumPy in one call and each column checked in
+    one call. The flat parse cannot tell where lines end, so the commas of
+    every line are counted first. A chunk with a line of the wrong length,
+    or which does not parse cleanly, is loaded again value by value so that
+    the offending line and column can be reported.
+
+    '''
+    commas = len(dformat) - 1
+    values = None
+    if all(line.count(',') == commas for line in lines):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            values = numpy.fromstring(''.join(lines).replace('\n', ','),
+                                      sep=',')
+    if values is None or values.size != len(lines) * len(dformat):
+        return numpy.array(loadlines(lines, first, dformat),
+                           dtype=numpy.float64)
+    values = values.reshape(len(lines), len(dformat))
+    for col, fmt in enumerate(dformat):
+        passed = checkcolumn(values[:, col], fmt)
+        if not passed.all():
+            row = numpy.flatnonzero(~passed)[0]
+            raise ValueError(
+                'line {}, column {}: {!r} fails value check'.format(
+                    first + row, col + 1, values[row, col].item()))
+    return values
+
+
+def loadbulk(fd, linect, dformat, pr, chunksize=CHUNKSIZE, sparse=False):
+    '''Load up to linect lines from an open file a chunk at a time.
+    Return a DataMatrix, or a SparseDataMatrix with sparse.
+
+    pr -- Progress instance advanced once per chunk
+
+    If the labels' coercer is not a numeric type, the labels cannot be
+    stored as they are parsed, so the lines are loaded value by value by
+    loadtext instead.
+
+    '''
+    ltype = labeltype(dformat)
+    if ltype is None:
+        data = loadtext(fd, linect, dformat, pr)
+        return SparseDataMatrix.fromdense(data) if sparse else data
+    labels = numpy.empty(linect, dtype=ltype)
+    if sparse:
+        chunks = [] # SparseMatrix per chunk
+    else:
+        features = numpy.empty((linect, len(dformat) - 1))
+    count = 0
+    while count < linect:
+        lines = list(itertools.islice(fd, min(chunksize, linect - count)))
+        if not lines:
+            break
+        values = loadchunk(lines, count + 1, dformat)
+        if sparse:
+            chunks.append(SparseMatrix.fromdense(values[:, :-1]))
+        else:
+            features[count:count + len(lines)] = values[:, :-1]
+        labels[count:count + len(lines)] = values[:, -1]
+        count += len(lines)
+        pr.next(len(lines))
+    if sparse:
+        if not chunks:
+            chunks.append(SparseMatrix.fromdense(
+                numpy.empty((0, len(dformat) - 1))))
+        return SparseDataMatrix(SparseMatrix.stack(chunks), labels[:count])
+    return DataMatrix(features[:count], labels[:count])
+
+
+def iterchunks(dfile, dformat, chunksize=CHUNKSIZE):
+    '''Load data from dfile according to dformat a chunk at a time.
+    Yield a 2-D array of values for every chunksize lines.
+
+    Unlike loadfile, the lines need not end with a label; dformat just has
+    one entry per value on a line.
+
+    '''
+    with open(dfile, mode='rb') as fd:
+        first = 1
+        while True:
+            lines = list(itertools.islice(fd, chunksize))
+            if not lines:
+                return
+            yield loadchunk(lines, first, dformat)
+            first += len(lines)
+
+
+def iterfile(dfile, dformat, chunksize=CHUNKSIZE, sparse=False):
+    '''Load labeled data from dfile according to dformat a chunk at a time.
+    Yield a DataMatrix, or a SparseDataMatrix with sparse, for every
+    chunksize lines.
+
+    Only one chunk is held in memory at once, so dfile may be larger than
+    memory. The file is read in the same format as loadfile with bulk.
+    Labels whose coercer is not a numeric type are kept as floats.
+
+    '''
+    ltype = labeltype(dformat) or numpy.dtype(numpy.float64)
+    for values in iterchunks(dfile, dformat, chunksize):
+        labels = values[:, -1].astype(ltype)
+        if sparse:
+            yield SparseDataMatrix(SparseMatrix.fromdense(values[:, :-1]),
+                                   labels)
+        else:
+            yield DataMatrix(values[:, :-1], labels)
+
+
+def loadfile(dfile, linect, dformat, bulk=False, cache=None,
+             showprogress=True, sparse=False):
     '''Load linect lines from labeled data in dfile according to dformat.
-    Return a list of DataPoint instances.
+    Return a DataMatrix, or a SparseDataMatrix with sparse.
 
     dfile   -- file name
                 -- one data point per line
@@ -49,40 +534,200 @@ def loadfile(dfile, linect, dformat):
                               6 * [(int,   lambda x: 0 < x           )] + \
                               1 * [(int,   lambda x: x == 1 or x == 0)]
 
+    bulk    -- parse whole chunks of lines at once instead of value by value
+                -- value checks are called on whole columns, so they should
+                   use & and | rather than chained comparisons, and or
+                   eg:
+                   >>> fmt = 48 * [(float, lambda x: (0 <= x) & (x <= 100))]
+                -- whole numbers in int columns may be written as floats
+                   (eg: 5.0 or 1e3), which int would reject value by value
+
+    cache   -- file name of a binary copy of the loaded data, or None
+                -- memory-mapped instead of loading dfile while dfile,
+                   linect and dformat are unchanged
+                -- written after loading dfile otherwise
+
+    showprogress -- whether to show the lines loaded so far, as a bar on a
+                    terminal and as log lines otherwise
+
+    sparse  -- keep only the nonzero feature values, in a SparseMatrix
+                -- with bulk, each chunk is made sparse as it is parsed, so
+                   the dense features are never all in memory
+                -- the cache holds dense data, so it cannot be used
+
+    Invalid values raise a ValueError naming the line and column, and lines
+    with the wrong number of values one naming the line.
+
     '''
+    if sparse and cache is not None:
+        raise ValueError('sparse data cannot be cached')
+    if cache is not None:
+        data = readcache(cache, dfile, linect, dformat)
+        if data is not None:
+            print 'Loaded "{}" from "{}"'.format(dfile, cache)
+            return data
     print 'Loading "{}"'.format(dfile)
-    data = []
+    if showprogress:
+        pr = pg.Progress(linect, 2, pg.auto('Lines', 32), every=1024)
+    else:
+        pr = pg.Quiet(linect)
     with open(dfile, mode='rb') as fd:
-        with pg.Progress(linect, 2, pg.bar('Lines', 32)) as pr:
-            for line in fd:
-                # clean the data & create the datapoint
-                cleandata = [loadfeature(raw.strip(), fmt) \
-                             for raw, fmt in zip(line.split(','), dformat)]
-                data += [DataPoint(cleandata[:-1], cleandata[-1])]
-                # indicate progress
-                try:
-                    pr.next()
-                except TypeError:
-                    break
+        with pr:
+            if bulk:
+                data = loadbulk(fd, linect, dformat, pr, sparse=sparse)
+            else:
+                data = loadtext(fd, linect, dformat, pr)
+                if sparse:
+                    data = SparseDataMatrix.fromdense(data)
+    if cache is not None:
+        writecache(cache, dfile, linect, dformat, data)
     return data
 
 
+def loadtext(fd, linect, dformat, pr):
+    '''Load up to linect lines from an open file value by value.
+    Return a DataMatrix.
+
+    pr -- Progress instance advanced once per line
+
+    '''
+    features = numpy.empty((linect, len(dformat) - 1))
+    labels = []
+    for line in itertools.islice(fd, linect):
+        # clean the data & store it as the next row
+        cleandata = loadlines([line], len(labels) + 1, dformat)[0]
+        features[len(labels)] = cleandata[:-1]
+        labels.append(cleandata[-1])
+        # indicate progress
+        pr.next()
+    return DataMatrix(features[:len(labels)], labels)
+
+
+###############################################################################
+
+
+def fingerprint(dformat):
+    '''Return a digest identifying the types and value checks of dformat.'''
+    digest = hashlib.sha1()
+    for changetype, checkvalue in dformat:
+        digest.update(changetype.__name__)
+        code = getattr(checkvalue, '__code__', None)
+        if code is None:
+            digest.update(repr(checkvalue))
+        else:
+            digest.update(code.co_code)
+            digest.update(repr(code.co_consts))
+            digest.update(repr(code.co_names))
+    return digest.digest()
+
+
+def filehash(dfile, blocksize=1 << 20):
+    '''Return a digest of the contents of dfile.'''
+    digest = hashlib.sha1()
+    with open(dfile, mode='rb') as fd:
+        for block in iter(lambda: fd.read(blocksize), ''):
+            digest.update(block)
+    return digest.digest()
+
+
+def readcache(cache, dfile, linect, dformat):
+    '''Memory-map the data in cache if it was written from the current dfile
+    with the same linect and dformat. Return a DataMatrix, or None if the
+    cache is missing or stale.
+
+    The source is trusted if its size and mtime are unchanged; if only its
+    mtime changed, its contents are hashed and compared instead, and on a
+    match the new mtime is written to the header so that later loads need
+    not hash it again.
+
+    The arrays are mapped copy-on-write: nothing is read until used, and
+    changes (eg: by applykernel) never reach the cache file.
+
+    '''
+    try:
+        with open(cache, mode='rb') as fd:
+            header = CACHEHEADER.unpack(fd.read(CACHEHEADER.size))
+    except (IOError, struct.error):
+        return None
+    magic, fmtdigest, mtime, size, srcdigest, count, rows, cols, ltype = header
+    stat = os.stat(dfile)
+    if magic != CACHEMAGIC or fmtdigest != fingerprint(dformat) or \
+       count != linect or size != stat.st_size:
+        return None
+    if mtime != stat.st_mtime and srcdigest != filehash(dfile):
+        return None
+    offset = cacheoffset()
+    ltype = numpy.dtype(ltype.rstrip('\0'))
+    if os.path.getsize(cache) != offset + rows * (cols * 8 + ltype.itemsize):
+        return None
+    if mtime != stat.st_mtime:
+        touchcache(cache, header, stat.st_mtime)
+    features = numpy.memmap(cache, dtype=numpy.float64, mode='c',
+                            offset=offset, shape=(rows, cols))
+    labels = numpy.memmap(cache, dtype=ltype, mode='c',
+                          offset=offset + features.nbytes, shape=(rows,))
+    return DataMatrix(features, labels)
+
+
+def writecache(cache, dfile, linect, dformat, data):
+    '''Write data loaded from dfile to cache for readcache.
+
+    The file is written under a temporary name and then renamed, so an
+    interrupted write never leaves a partial cache behind.
+
+    '''
+    stat = os.stat(dfile)
+    labels = numpy.ascontiguousarray(data.labels)
+    header = CACHEHEADER.pack(CACHEMAGIC, fingerprint(dformat),
+                              stat.st_mtime, stat.st_size, filehash(dfile),
+                              linect, len(data), data.width,
+                              labels.dtype.str)
+    partial = cache + '.partial'
+    with open(partial, mode='wb') as fd:
+        fd.write(header.ljust(cacheoffset(), '\0'))
+        fd.write(numpy.ascontiguousarray(data.features).tostring())
+        fd.write(labels.tostring())
+    os.rename(partial, cache)
+
+
+def touchcache(cache, header, mtime):
+    '''Rewrite the source mtime in the header of cache, in place. A cache
+    which cannot be written is left as it is, to be hashed again next time.
+    '''
+    header = header[:2] + (mtime,) + header[3:]
+    try:
+        with open(cache, mode='r+b') as fd:
+            fd.write(CACHEHEADER.pack(*header))
+    except IOError:
+        pass
+
+
+def cacheoffset():
+    '''Return the byte offset of the arrays in a cache file.'''
+    return -(-CACHEHEADER.size // CACHEALIGN) * CACHEALIGN
+
+
 ###############################################################################
 
 
 def applykernel(data, kernel):
     '''Apply a function to each vector of feature values *IN PLACE*.
-    Return a list of DataPoint instances.
 
-    data -- list of DataPoint instances
+    data -- DataMatrix, or list of DataPoint instances
 
     kn   -- function [[number] --> [number]]
          -- transform a single feature for all datapoints
 
-    NOTE: Transformation is not performed in place, but resultant data is
-    stored in place.
+    A DataMatrix has each column handed to kernel as a view and the result
+    written back into the same column, so nothing is transposed. For a list
+    of DataPoint instances the transformation is not performed in place, but
+    the resultant data is stored in place.
 
     '''
+    if isinstance(data, DataMatrix):
+        for j in xrange(data.width):
+            data.column(j)[:] = kernel(data.column(j))
+        return
     # rotate to a list of feature vectors
     lofv = zip(*[dp.features for dp in data])
     # transform each vector
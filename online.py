@@ -0,0 +1,167 @@
+# third-party
+import numpy
+# local
+import checkpoint
+import dataset
+import predictor
+import regression as rg
+import scaler as sc
+import spambase
+
+
+INDENT = '  '
+REPORTEVERY = 500 # rows between reports in __main__
+
+
+###############################################################################
+
+
+class OnlineLearner(object):
+    '''Keeps the weights of a regression up to date as labeled rows arrive.
+
+    regression   -- regression.Regression or regression.LogisticRegression
+    width        -- number of feature values in each row, without a label
+                    or phantom feature
+    learningrate -- learning rate for the first row
+    decay        -- the learning rate for row t (from 0) is
+                    learningrate / (1 + decay * t)
+
+    Rows are taken raw, as loaded. Each one first updates a scaler.Scaler,
+    is then z-scored by it and given a phantom feature as
+    regression.preprocess would, and finally makes one
+    GradientDescent.stochastic update. The weights can be used to score at
+    any time, through score or predictor.
+
+    '''
+
+    def __init__(self, regression, width, learningrate=0.1, decay=0.001):
+        self.regression = regression
+        self.learningrate = learningrate
+        self.decay = decay
+        self.weights = numpy.zeros(width + 1) # phantom weight first
+        self.scaler = sc.Scaler(width) # of the rows learned from
+
+    @property
+    def width(self):
+        '''Number of feature values in each row.'''
+        return self.scaler.width
+
+    @property
+    def count(self):
+        '''Number of rows learned from.'''
+        return self.scaler.count
+
+    def rate(self):
+        '''Return the learning rate for the next row.'''
+        return self.learningrate / (1.0 + self.decay * self.count)
+
+    def transform(self, features):
+        '''Z-score a row of raw features, or each row of a matrix of them,
+        with the statistics so far, and prepend the phantom feature.
+        Return a new array.
+        '''
+        z = self.scaler.transform(numpy.array(features, dtype=numpy.float64))
+        phantom = numpy.ones(z.shape[:-1] + (1,))
+        return numpy.concatenate((phantom, z), axis=-1)
+
+    def score(self, features):
+        '''Score a row of raw features, or each row of a matrix of them.'''
+        return self.predictor().score(features)
+
+    def predictor(self):
+        '''Return a predictor.Predictor for raw features with a copy of the
+        current weights and statistics.
+        '''
+        return predictor.Predictor(self.weights, self.regression,
+                                   self.scaler.copy())
+
+    def update(self, features, label):
+        '''Learn from one labeled row of raw features.
+
+        Return the row's score just before the update, so that the error of
+        the scores given to rows not yet learned from can be tracked.
+
+        '''
+        learningrate = self.rate()
+        # update the running statistics first
+        self.scaler.update(features)
+        # then as GradientDescent.stochastic, on the live weights
+        row = self.transform(features)
+        with numpy.errstate(over='ignore'):
+            s = self.regression.model(self.weights, row)
+        self.weights -= learningrate * self.regression.gradient(s, row, label)
+        return s
+
+    def learn(self, data):
+        '''Learn from every row of a DataMatrix in turn. Return the root
+        mean squared error of their scores just before each update.
+        '''
+        sse = 0.0
+        for features, label in zip(data.features, data.labels.tolist()):
+            sse += (self.update(features, label) - label) ** 2
+        return (sse / len(data)) ** 0.5
+
+    def save(self, path):
+        '''Save the weights and statistics to path.'''
+        checkpoint.save(path,
+                        regression=numpy.array(self.regression.__name__),
+                        learningrate=numpy.float64(self.learningrate),
+                        decay=numpy.float64(self.decay),
+                        weights=self.weights,
+                        **self.scaler.arrays())
+
+    @classmethod
+    def load(cls, path, regressions=rg.REGRESSIONS):
+        '''Load an OnlineLearner saved to path, to carry on learning.'''
+        arrays = checkpoint.load(path)
+        name = arrays['regression'].item()
+        for regression in regressions:
+            if regression.__name__ == name:
+                break
+        else:
+            raise ValueError('"{}" is a learner for unknown regression '
+                             '{}'.format(path, name))
+        learner = cls(regression, len(arrays['weights']) - 1,
+                      arrays['learningrate'].item(), arrays['decay'].item())
+        learner.weights = arrays['weights']
+        learner.scaler = sc.Scaler.fromarrays(arrays)
+        return learner
+
+    def __repr__(self):
+        return '{}({}, {} rows, learning rate {})'.format(
+            self.__class__.__name__, self.regression.__name__, self.count,
+            self.rate())
+
+
+###############################################################################
+
+
+if __name__ == '__main__':
+    print
+
+    # load from file; the learner does its own preprocessing
+    spambase.load()
+    d = spambase.data
+
+    # hold out the first fold, and stream the others in a random order
+    testing, training = rg.holdout(rg.folds(len(d)), 0)
+    testing = d[testing]
+    training = d[training]
+
+    for regression, learningrate in [(rg.Regression, 0.001),
+                                     (rg.Regression.LogisticRegression, 0.1)]:
+        print '== Online {} =='.format(regression.__name__)
+        learner = OnlineLearner(regression, training.width, learningrate)
+        for start in xrange(0, len(training), REPORTEVERY):
+            rows = training[start:start + REPORTEVERY]
+            print INDENT + 'Rows {}-{}: RMSE before learning {}'.format(
+                start + 1, start + len(rows), learner.learn(rows))
+        terror, roc, auc = rg.evaluate(
+            learner.weights, dataset.DataMatrix(
+                learner.transform(testing.features), testing.labels),
+            regression)
+        print INDENT + 'Testing RMSE:', terror
+        print INDENT + 'AUC:', auc
+
+
+###############################################################################
@@ -0,0 +1,186 @@
+# stdlib
+import multiprocessing
+import time
+# third-party
+import numpy
+# local
+import crossval
+import regression as rg
+import spambase
+import telemetry
+
+
+INDENT = '  '
+
+
+###############################################################################
+
+
+# set in each worker process by initworker
+workerfeatures = None
+workerlabels = None
+workerfunctions = None
+
+
+def initworker(features, labels, functions):
+    '''Give a worker process the shared training data.'''
+    global workerfeatures, workerlabels, workerfunctions
+    workerfeatures = features
+    workerlabels = labels
+    workerfunctions = functions
+
+
+def shardgradient(task):
+    '''Sum the gradients over one shard in a worker process, as
+    regression.GradientDescent.sumgradient does.
+
+    task -- tuple of the shard's first and last (excluded) rows, the
+            weights and the indices of the score and gradient functions in
+            FUNCTIONS
+
+    '''
+    start, stop, weights, score, gradient = task
+    return rg.GradientDescent.sumgradient(
+        weights, workerfeatures[start:stop], workerlabels[start:stop],
+        workerfunctions[score], workerfunctions[gradient])
+
+
+def sharderror(task):
+    '''Sum the squared errors over one shard in a worker process.
+
+    task -- tuple of the shard's first and last (excluded) rows, the
+            weights and the index of the score function in FUNCTIONS
+
+    '''
+    start, stop, weights, score = task
+    with numpy.errstate(over='ignore', invalid='ignore'):
+        residuals = workerfunctions[score](
+            weights, workerfeatures[start:stop]) - workerlabels[start:stop]
+        return float(residuals.dot(residuals))
+
+
+# the functions workers can be asked to score and take gradients with, since
+# functions nested in classes cannot be pickled into tasks
+FUNCTIONS = [f for r in rg.REGRESSIONS for f in (r.model, r.gradient)]
+
+
+###############################################################################
+
+
+class Shards(object):
+    '''Training data split into shards for a pool of worker processes.
+
+    training  -- dataset.DataMatrix, already preprocessed
+    processes -- number of worker processes and of shards; defaults to the
+                 cpu count
+
+    The data is copied into shared memory once, and the workers are started
+    once and kept until close, so each pass sends the workers only the
+    weights and gets back one partial sum per shard. Use as a context
+    manager, or call close when done.
+
+    '''
+
+    def __init__(self, training, processes=None):
+        self.training = training
+        self.processes = processes or multiprocessing.cpu_count()
+        features = crossval.share(training.features)
+        labels = crossval.share(training.labels)
+        bounds = numpy.linspace(0, len(training), self.processes + 1)
+        bounds = bounds.round().astype(int).tolist()
+        self.bounds = [(start, stop) for start, stop in zip(bounds, bounds[1:])
+                       if stop > start]
+        self.pool = multiprocessing.Pool(self.processes, initworker,
+                                         (features, labels, FUNCTIONS))
+
+    def check(self, datapoints):
+        '''Raise a ValueError unless datapoints is the sharded data.'''
+        if datapoints is not self.training:
+            raise ValueError('{!r} is not the sharded training data'.format(
+                datapoints))
+
+    def sumgradient(self, weights, score, gradient):
+        '''Sum the gradients of each weight over every shard at once.'''
+        task = (FUNCTIONS.index(score), FUNCTIONS.index(gradient))
+        weights = numpy.asarray(weights, dtype=numpy.float64)
+        return sum(self.pool.map(shardgradient,
+                                 [(start, stop, weights) + task \
+                                  for start, stop in self.bounds]))
+
+    def error(self, weights, datapoints, score):
+        '''Calculate the root mean squared error of weights over the
+        sharded data, as regression.GradientDescent.error does.
+        '''
+        self.check(datapoints)
+        task = (FUNCTIONS.index(score),)
+        weights = numpy.asarray(weights, dtype=numpy.float64)
+        sse = sum(self.pool.map(sharderror, [(start, stop, weights) + task \
+                                             for start, stop in self.bounds]))
+        error = (sse / len(datapoints)) ** 0.5
+        if not numpy.isfinite(error):
+            raise OverflowError('training error is not finite')
+        return error
+
+    def batch(self):
+        '''Make a gdfunction like regression.GradientDescent.batch which
+        sums the gradients across the workers, and whose error attribute
+        finds the training error across them too (see
+        regression.GradientDescent.loop). Both only take the sharded data.
+        '''
+        def batch(weights, datapoints, score, gradient, learningrate):
+            self.check(datapoints)
+            sums = self.sumgradient(weights, score, gradient)
+            return (numpy.asarray(weights) - learningrate * sums).tolist()
+        batch.error = self.error # see loop
+        return batch
+
+    def close(self):
+        '''Stop the worker processes.'''
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return '{}({} rows, {} shards)'.format(self.__class__.__name__,
+                                               len(self.training),
+                                               len(self.bounds))
+
+
+###############################################################################
+
+
+if __name__ == '__main__':
+    print
+
+    # load from file
+    spambase.load()
+    d = spambase.data
+    rg.preprocess(d)
+    testing, training = rg.holdout(rg.folds(len(d)), 0)
+    testing = d[testing]
+    training = d[training]
+
+    # the batch learners, in one process and then across all of them
+    with Shards(training) as shards:
+        print 'Shards:', len(shards.bounds)
+        for reg, gdfunc, lr in rg.LEARNERS:
+            if gdfunc is not rg.GradientDescent.batch:
+                continue
+            print '== {} =='.format(reg.__name__)
+            for name, gdfunction in [('serial', gdfunc),
+                                     ('parallel', shards.batch())]:
+                begun = time.time()
+                weights = rg.learn(gdfunction, training, reg, lr,
+                                   callback=telemetry.quiet)
+                elapsed = time.time() - begun
+                terror, roc, auc = rg.evaluate(weights, testing, reg)
+                print INDENT + '{}: {:.3f}s, Testing RMSE {}, AUC {}'.format(
+                    name, elapsed, terror, auc)
+
+
+###############################################################################
@@ -1,49 +1,362 @@
+# stdlib
+import collections
+import sys
+# third-party
+import numpy
 # local
-import stats
+import dataset
+import regression as rg
+import resultset
+import spambase
+
+
+INDENT = '  '
+MAXEPOCHS = 100 # passes through the data before giving up on separating it
+BLOCKSIZE = 256 # rows whose margins are checked at once
+CACHESIZE = 1024 # Gram matrix rows kept by a KernelPerceptron
+VOTEBLOCK = 4096 # weight vectors of a voted Perceptron scored at once
+
+
+###############################################################################
+
+
+def signs(labels):
+    '''Map labels to -1 and 1: positive labels to 1 and others (0 or -1)
+    to -1. Return an array of floats.
+    '''
+    return numpy.where(numpy.asarray(labels) > 0, 1.0, -1.0)
+
+
+def epoch(count, margins, update, blocksize=BLOCKSIZE):
+    '''Make one perceptron pass through count rows. Return the row numbers
+    of the mistakes, in order.
+
+    margins   -- function [start stop --> array] giving the margins (label
+                 times score, with labels -1 or 1) of rows start up to stop
+                 under the current weights
+    update    -- function [row -->] called on each mistake, which changes
+                 the weights
+    blocksize -- number of rows whose margins are computed at once
+
+    The rows are visited in order, as by the row-by-row perceptron, but
+    their margins are computed a block at a time. After a mistake only the
+    rest of its block is checked again, under the new weights, so a pass
+    makes exactly the updates the row-by-row loop would.
+
+    '''
+    made = []
+    start = 0
+    while start < count:
+        stop = min(start + blocksize, count)
+        wrong = numpy.flatnonzero(margins(start, stop) <= 0)
+        if len(wrong):
+            i = start + int(wrong[0])
+            update(i)
+            made.append(i)
+            start = i + 1
+        else:
+            start = stop
+    return made
+
+
+###############################################################################
+
+
+# perceptron modes
+MODES = ('plain', 'averaged', 'voted')
+
+
+class Perceptron(object):
+    '''A linear perceptron learner for a dataset.DataMatrix.
+
+    mode      -- 'plain' to keep the final weights; 'averaged' to keep the
+                 average of the weights after every row of every pass;
+                 'voted' to keep every weight vector, each voting with the
+                 number of rows it was used for
+    maxepochs -- maximum number of passes through the data; learning stops
+                 sooner after a pass without mistakes
+    blocksize -- as for epoch
+
+    Labels may be 0 and 1 or -1 and 1. Averaging and voting make a
+    perceptron useful on data which is not linearly separable, where the
+    final weights depend on the last few mistakes.
+
+    '''
+
+    def __init__(self, mode='plain', maxepochs=MAXEPOCHS,
+                 blocksize=BLOCKSIZE):
+        if mode not in MODES:
+            raise ValueError('unknown perceptron mode ' + repr(mode))
+        self.mode = mode
+        self.maxepochs = maxepochs
+        self.blocksize = blocksize
+        self.weights = None # learned by fit, except when voted
+        self.vectors = None # weight vectors, one per row, when voted
+        self.votes = None # of each weight vector, when voted
+        self.epochs = [] # number of mistakes in each pass
+
+    def fit(self, data):
+        '''Learn weights from a DataMatrix. Return self.'''
+        x = numpy.asarray(data.features, dtype=numpy.float64)
+        y = signs(data.labels)
+        w = numpy.zeros(x.shape[1])
+        # for averaging, the sum of each update times the rows before it
+        u = numpy.zeros(x.shape[1])
+        # for voting, each weight vector and the row it was made on
+        vectors, steps = [w.copy()], [0]
+        self.epochs = []
+        while len(self.epochs) < self.maxepochs:
+            offset = len(self.epochs) * len(x) # rows visited before
+            def margins(start, stop):
+                return y[start:stop] * x[start:stop].dot(w)
+            def update(i):
+                delta = y[i] * x[i]
+                w[:] += delta
+                if self.mode == 'averaged':
+                    u[:] += (offset + i) * delta
+                elif self.mode == 'voted':
+                    vectors.append(w.copy())
+                    steps.append(offset + i + 1)
+            self.epochs.append(len(epoch(len(x), margins, update,
+                                         self.blocksize)))
+            if not self.epochs[-1]:
+                break
+        total = len(self.epochs) * len(x) # rows visited
+        if self.mode == 'voted':
+            self.vectors = numpy.array(vectors)
+            self.votes = numpy.diff(steps + [total]).astype(numpy.float64)
+        elif self.mode == 'averaged':
+            self.weights = w - u / total
+        else:
+            self.weights = w
+        return self
+
+    def score(self, features):
+        '''Score a row of features, or each row of a matrix of them; the
+        higher the score, the more likely the label is positive.
+        '''
+        features = numpy.asarray(features, dtype=numpy.float64)
+        if self.mode == 'voted':
+            return self.vote(features)
+        return features.dot(self.weights)
+
+    def vote(self, features):
+        '''Score features by the votes of every weight vector.
+
+        There can be a weight vector for every mistake made in training, so
+        the signs are found for blocksize rows and VOTEBLOCK vectors at a
+        time and their votes added up, rather than for all rows and vectors
+        at once.
+
+        '''
+        if features.ndim == 1:
+            return self.vote(features[numpy.newaxis])[0]
+        scores = numpy.zeros(len(features))
+        for start in xrange(0, len(features), self.blocksize):
+            rows = features[start:start + self.blocksize]
+            for first in xrange(0, len(self.vectors), VOTEBLOCK):
+                last = first + VOTEBLOCK
+                scores[start:start + len(rows)] += numpy.sign(
+                    rows.dot(self.vectors[first:last].T)).dot(
+                        self.votes[first:last])
+        return scores
+
+    def predict(self, features):
+        '''Label a row of features, or each row of a matrix of them, as 1 or
+        0.
+        '''
+        return (self.score(features) > 0).astype(int)
+
+    def __repr__(self):
+        return '{}({}, {} epochs)'.format(self.__class__.__name__, self.mode,
+                                          len(self.epochs))
+
+
+###############################################################################
+#
+# Kernels take two matrices with a row of features per datapoint and return
+# the matrix of the kernel function between every row of the first and
+# every row of the second.
+#
+###############################################################################
+
+
+def polynomial(degree, coef=1.0):
+    '''Make a kernel (x . z + coef) ** degree.'''
+    def polynomial(a, b):
+        return (a.dot(b.T) + coef) ** degree
+    return polynomial
+
+
+def rbf(gamma):
+    '''Make a kernel e ** (-gamma * |x - z| ** 2).'''
+    def rbf(a, b):
+        sq = (numpy.einsum('ij,ij->i', a, a)[:, numpy.newaxis] +
+              numpy.einsum('ij,ij->i', b, b)[numpy.newaxis, :] -
+              2 * a.dot(b.T))
+        return numpy.exp(-gamma * numpy.maximum(sq, 0.0))
+    return rbf
+
+
+class KernelPerceptron(object):
+    '''A perceptron learner in the dual form, for any kernel.
+
+    kernel    -- function [matrix matrix --> matrix], eg: from polynomial
+                 or rbf
+    mode      -- 'plain' or 'averaged', as for Perceptron
+    maxepochs -- as for Perceptron
+    blocksize -- as for epoch, and the number of rows scored at once
+    cachesize -- number of rows of the training Gram matrix to keep
+
+    The weights are a count of mistakes per training row. The score of
+    every training row is kept up to date as they change, so checking a
+    margin costs nothing and each mistake costs one Gram matrix row: the
+    kernel between the mistaken row and all of the others. Rows are
+    mistaken again and again on data which is not separable, so the most
+    recently used Gram rows are cached.
+
+    '''
+
+    def __init__(self, kernel, mode='plain', maxepochs=MAXEPOCHS,
+                 blocksize=BLOCKSIZE, cachesize=CACHESIZE):
+        if mode not in MODES[:2]:
+            raise ValueError('unknown kernel perceptron mode ' + repr(mode))
+        self.kernel = kernel
+        self.mode = mode
+        self.maxepochs = maxepochs
+        self.blocksize = blocksize
+        self.cachesize = cachesize
+        self.support = None # training rows with nonzero coefficients
+        self.coefficients = None # of each support row
+        self.epochs = [] # number of mistakes in each pass
+        self.gramrows = 0 # Gram matrix rows computed, not from the cache
+
+    def fit(self, data):
+        '''Learn from a DataMatrix. Return self.'''
+        x = numpy.asarray(data.features, dtype=numpy.float64)
+        y = signs(data.labels)
+        alpha = numpy.zeros(len(x)) # mistakes per row
+        u = numpy.zeros(len(x)) # for averaging, as in Perceptron.fit
+        scores = numpy.zeros(len(x)) # of every row under alpha
+        cache = collections.OrderedDict() # least recently used first
+        self.epochs = []
+        self.gramrows = 0
+        def gram(i):
+            if i in cache:
+                row = cache.pop(i)
+            else:
+                row = self.kernel(x, x[i:i + 1])[:, 0]
+                self.gramrows += 1
+                if len(cache) >= self.cachesize:
+                    cache.popitem(last=False)
+            cache[i] = row
+            return row
+        while len(self.epochs) < self.maxepochs:
+            offset = len(self.epochs) * len(x) # rows visited before
+            def margins(start, stop):
+                return y[start:stop] * scores[start:stop]
+            def update(i):
+                alpha[i] += 1
+                scores[:] += y[i] * gram(i)
+                if self.mode == 'averaged':
+                    u[i] += offset + i
+            self.epochs.append(len(epoch(len(x), margins, update,
+                                         self.blocksize)))
+            if not self.epochs[-1]:
+                break
+        if self.mode == 'averaged':
+            alpha -= u / (len(self.epochs) * len(x))
+        support = numpy.flatnonzero(alpha)
+        self.support = x[support]
+        self.coefficients = alpha[support] * y[support]
+        return self
+
+    def score(self, features):
+        '''Score a row of features, or each row of a matrix of them; the
+        higher the score, the more likely the label is positive.
+        '''
+        features = numpy.asarray(features, dtype=numpy.float64)
+        if features.ndim == 1:
+            return self.score(features[numpy.newaxis])[0]
+        return numpy.concatenate(
+            [self.kernel(self.support, features[start:start +
+                                                self.blocksize]).T.dot(
+                self.coefficients)
+             for start in xrange(0, len(features), self.blocksize)] or
+            [numpy.zeros(0)])
+
+    def predict(self, features):
+        '''Label a row of features, or each row of a matrix of them, as 1 or
+        0.
+        '''
+        return (self.score(features) > 0).astype(int)
+
+    def __repr__(self):
+        return '{}({}, {} epochs, {} support rows)'.format(
+            self.__class__.__name__, self.mode, len(self.epochs),
+            0 if self.support is None else len(self.support))
+
+
+###############################################################################
+
+
+def evaluate(learner, testing):
+    '''Return the ROC data and AUC of a fitted learner on a DataMatrix, as
+    regression.evaluate does for learned weights.
+    '''
+    results = [resultset.DataResult(label, score) \
+               for label, score in zip(testing.labels.tolist(),
+                                       learner.score(testing.features))]
+    roc = resultset.rocdata(results)
+    return roc, resultset.auc(roc)
+
+
+###############################################################################
 
 
 if __name__ == '__main__':
 
+    if sys.argv[1:] == ['spambase']:
+        print
+
+        # compare the perceptrons on spambase, as regression.py does
+        spambase.load()
+        d = spambase.data
+        rg.preprocess(d)
+        testing, training = rg.holdout(rg.folds(len(d)), 0)
+        testing = d[testing]
+        training = d[training]
+
+        for learner in [Perceptron(),
+                        Perceptron('averaged'),
+                        Perceptron('voted'),
+                        KernelPerceptron(polynomial(2), 'averaged', 20),
+                        KernelPerceptron(rbf(0.01), 'averaged', 20)]:
+            learner.fit(training)
+            roc, auc = evaluate(learner, testing)
+            print '== {} =='.format(learner)
+            print INDENT + 'Mistakes in the last epoch:', learner.epochs[-1]
+            print INDENT + 'AUC:', auc
+        sys.exit()
+
     # load from file
-    data = []
-    with open('perceptronData.txt', mode='rb') as fd:
-        for line in fd:
-            data.append([float(field.strip()) for field in line.split('\t')])
-    count = len(data)
+    values = numpy.loadtxt('perceptronData.txt', delimiter='\t', ndmin=2)
+    data = dataset.DataMatrix(values[:, :-1], values[:, -1])
+
+    # visit positive examples first, then negative ones
+    data = data[numpy.concatenate((numpy.flatnonzero(data.labels == 1.0),
+                                   numpy.flatnonzero(data.labels == -1.0)))]
 
     # add phantom feature
-    for d in data:
-        d.insert(0, 1.0)
-
-    # split into positive and negative sets
-    pos = [d[:-1] for d in data if d[-1] ==  1.0]
-    neg = [d[:-1] for d in data if d[-1] == -1.0]
-    assert len(pos) + len(neg) == count
-    del data
-
-    # invert negative examples; put them in positive set
-    for d in neg:
-        pos.append([-f for f in d])
-    assert len(pos) == count
-    del neg
-
-    # initialize the weight vector
-    weights = len(pos) * [0.0]
-
-    # iterate
-    iteration = 0
-    mistakes = 1
-    while mistakes: # should be while iteration < (m * |v|^2) / (d^2)
-        iteration += 1
-        mistakes = 0
-        for d in pos:
-            if stats.dotprod(weights, d) > 0:
-                pass # good!
-            else:
-                weights = [w + f for w, f in zip(weights, d)]
-                mistakes += 1
-        print 'Iteration {}, total mistakes {}'.format(iteration, mistakes)
+    data.prepend(1.0)
+
+    # iterate until no mistakes are made
+    learner = Perceptron().fit(data)
+    for iteration, mistakes in enumerate(learner.epochs):
+        print 'Iteration {}, total mistakes {}'.format(iteration + 1,
+                                                      mistakes)
 
+    weights = learner.weights.tolist()
     print 'Classifier weights: {}'.format(
         ' '.join([str(w) for w in weights]))
 
@@ -0,0 +1,113 @@
+# third-party
+import numpy
+# local
+import checkpoint
+import dataset
+import scaler as sc
+
+
+###############################################################################
+
+
+class Predictor(object):
+    '''Scores data with weights learned for a regression.
+
+    weights    -- list of learned weights
+    regression -- regression.Regression or regression.LogisticRegression
+    scaler     -- scaler.Scaler the training data was z-scored with, or None
+
+    Whole arrays of rows are scored at once; nothing is done per row in
+    Python. Without a scaler, features are scored as given, so they must
+    already be preprocessed; with one, they are raw feature values, which
+    are z-scored and given the phantom feature before scoring. Features may
+    also be a dataset.SparseMatrix: preprocessed, or raw with a scaler which
+    does not center, as regression.preprocess returns for sparse data.
+
+    '''
+
+    def __init__(self, weights, regression, scaler=None):
+        self.weights = numpy.array(weights, dtype=numpy.float64)
+        self.regression = regression
+        self.scaler = scaler
+
+    def score(self, features):
+        '''Score a row of features, or each row of a matrix of them.
+        [number] --> number, or [[number]] --> [number]
+        '''
+        if not isinstance(features, dataset.SparseMatrix):
+            features = numpy.asarray(features, dtype=numpy.float64)
+        if self.scaler is not None:
+            z = self.scaler.transform(features.copy())
+            if isinstance(z, dataset.SparseMatrix):
+                features = z.prepend(1.0)
+            else:
+                features = numpy.concatenate(
+                    (numpy.ones(z.shape[:-1] + (1,)), z), axis=-1)
+        with numpy.errstate(over='ignore'):
+            return self.regression.model(self.weights, features)
+
+    def predict(self, features, operating_point):
+        '''Label a row of features, or each row of a matrix of them, as 1 if
+        its score is above the operating point and as 0 otherwise.
+        '''
+        return (self.score(features) > operating_point).astype(int)
+
+    def scorefile(self, infile, outfile, dformat, labeled=True,
+                  transform=None, chunksize=dataset.CHUNKSIZE):
+        '''Score every line of infile a chunk at a time, writing one score per
+        line to outfile. Return the number of lines scored.
+
+        infile    -- file name, read as by dataset.iterchunks
+        outfile   -- file name
+        dformat   -- data format list for the lines of infile
+        labeled   -- whether the final value of each line is a label, which
+                     is then ignored
+        transform -- function [[[number]] --> [[number]]] applied to the
+                     features of each chunk before scoring, eg: to add the
+                     phantom feature when there is no scaler
+
+        '''
+        count = 0
+        with open(outfile, mode='wb') as fd:
+            for values in dataset.iterchunks(infile, dformat, chunksize):
+                features = values[:, :-1] if labeled else values
+                if transform is not None:
+                    features = transform(features)
+                numpy.savetxt(fd, self.score(features), fmt='%.17g')
+                count += len(values)
+        return count
+
+    def save(self, path):
+        '''Save the weights, the name of the regression and any scaler to
+        path.
+        '''
+        arrays = {} if self.scaler is None else self.scaler.arrays()
+        checkpoint.save(path, weights=self.weights,
+                        regression=numpy.array(self.regression.__name__),
+                        **arrays)
+
+    @classmethod
+    def load(cls, path, regressions):
+        '''Load a Predictor saved to path.
+
+        regressions -- the regressions the saved one may be, eg:
+                       regression.REGRESSIONS
+
+        '''
+        arrays = checkpoint.load(path)
+        name = arrays['regression'].item()
+        for regression in regressions:
+            if regression.__name__ == name:
+                return cls(arrays['weights'], regression,
+                           sc.Scaler.fromarrays(arrays))
+        raise ValueError('"{}" is a model for unknown regression {}'.format(
+            path, name))
+
+    def __repr__(self):
+        return '{}({}, {}{})'.format(
+            self.__class__.__name__, self.weights.tolist(),
+            self.regression.__name__,
+            '' if self.scaler is None else ', ' + repr(self.scaler))
+
+
+###############################################################################
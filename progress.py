@@ -4,12 +4,26 @@ import time
 
 
 class Progress(object):
-    '''A context manager to indicate progress at intervals via a callback.'''
+    '''A context manager to indicate progress at intervals via a callback.
 
-    def __init__(self, total, timeout=0, callback=None):
+    total   -- number of items, or None if it is not known in advance
+    timeout -- minimum number of seconds between calls to the callback
+    every   -- number of items between reads of the clock; raise it when
+               next is called once per item in a hot loop
+
+    The callback is called with the number of items completed, the total and
+    the seconds elapsed, and always once more on completion. done becomes
+    true on completion; any further calls to next do nothing.
+
+    '''
+
+    def __init__(self, total, timeout=0, callback=None, every=1):
         # item count
         self.current = None
         self.total = total
+        self.every = every
+        self.check = None # item count at which to next read the clock
+        self.done = False
         # elapsed time
         self.begun = None
         # callback
@@ -18,7 +32,8 @@ class Progress(object):
         if callback is None:
             def fn(current, total, elapsed):
                 print 'Completed {} of {} items; {} elapsed.'.format(
-                    current, total, format_time(1000 * elapsed))
+                    current, '?' if total is None else total,
+                    format_time(1000 * elapsed))
             self.callback = fn
         else:
             self.callback = callback
@@ -28,6 +43,8 @@ class Progress(object):
         now = time.time()
         # item count
         self.current = 0
+        self.check = self.every
+        self.done = False
         # elapsed time
         self.begun = now
         # callback
@@ -36,32 +53,77 @@ class Progress(object):
         return self # this cm is meant to be used like "Progress(...) as smth"
 
     def next(self, did=1):
-        # local
-        now = time.time()
+        '''Record that did more items have been completed.'''
+        if self.done:
+            return
         # item count
         self.current += did
         # determine if we're done
-        if self.current >= self.total:
-            self.next = None
+        finished = self.total is not None and self.current >= self.total
+        if self.current < self.check and not finished:
+            return # cheaply, without reading the clock
+        self.check = self.current + self.every
+        # local
+        now = time.time()
         # callback
-        if (now - self.prev) > self.timeout or self.next is None:
+        if (now - self.prev) > self.timeout or finished:
+            self.done = finished
             self.prev = now
             return self.callback(self.current, self.total, now - self.begun)
 
+    def wrap(self, iterable):
+        '''Yield the items of iterable, counting each one as completed.'''
+        for item in iterable:
+            yield item
+            self.next()
+
     def __exit__(self, e_type, e_value, e_traceback):
         # make final call to callback
         self.timeout = 0
-        if self.next is not None:
+        if not self.done:
+            if self.total is None:
+                self.total = self.current
             self.next(self.total - self.current)
-            self.next = None
         return False # this cm doesn't care about exceptions
 
 
+class Quiet(object):
+    '''A stand-in for Progress which does nothing at all, for when progress
+    is not wanted. It takes the same arguments.
+    '''
+
+    def __init__(self, total=None, timeout=0, callback=None, every=1):
+        self.total = total
+        self.done = False
+
+    def __enter__(self):
+        return self
+
+    def next(self, did=1):
+        pass
+
+    def wrap(self, iterable):
+        return iterable
+
+    def __exit__(self, e_type, e_value, e_traceback):
+        self.done = True
+        return False
+
+
 def bar(message=None, width=10):
-    '''Generate a callback for Progress which makes a bar like [##---].'''
+    '''Generate a callback for Progress which makes a bar like [##---].
+
+    While the total is not known there is no bar, just the count so far.
+
+    '''
     message = '' if message is None else (message + ' ')
     def fn(current, total, elapsed):
-        blocks = int(float(current) / total * width)
+        if total is None:
+            sys.stdout.write('\r{}{}/? {}'.format(
+                message, current, format_time(1000 * elapsed)))
+            sys.stdout.flush()
+            return
+        blocks = int(float(current) / total * width) if total else width
         sys.stdout.write('\r{}[{}{}] {:{w}}/{} {}{}'.format(
             message,
             blocks * '#',
@@ -76,6 +138,29 @@ def bar(message=None, width=10):
     return fn
 
 
+def log(message=None, stream=None):
+    '''Generate a callback for Progress which writes a line per call, for
+    logs and other output which is not a terminal.
+    '''
+    message = '' if message is None else (message + ': ')
+    def fn(current, total, elapsed):
+        out = sys.stdout if stream is None else stream
+        out.write('{}{}/{} {}\n'.format(message, current,
+                                       '?' if total is None else total,
+                                       format_time(1000 * elapsed)))
+        out.flush()
+    return fn
+
+
+def auto(message=None, width=10):
+    '''Generate a bar callback if stdout is a terminal and a log callback
+    otherwise.
+    '''
+    if sys.stdout.isatty():
+        return bar(message, width)
+    return log(message)
+
+
 def format_time(milliseconds):
     '''Return a human-readable string from the given number of milliseconds.
 
@@ -1,11 +1,20 @@
 # stdlib
+import collections
+import os
 import random
+import time
+# third-party
+import numpy
 # local
+import checkpoint
 import progress as pg
 import resultset
+import scaler
 import spambase
 import dataset
+import predictor
 import stats
+import telemetry
 
 
 FOLDCOUNT = 10
@@ -25,7 +34,13 @@ class Regression(object):
     def model(weights, features):
         '''Calculate regression for features given weights.
         [number] [number] --> number
+
+        Given an array of features, the product is done by NumPy; given a
+        matrix of feature rows, a vector with one score per row is returned.
+        A dataset.SparseMatrix is multiplied by its nonzero values only.
         '''
+        if isinstance(features, (numpy.ndarray, dataset.SparseMatrix)):
+            return features.dot(weights)
         return stats.dotprod(weights, features)
 
     @staticmethod
@@ -35,6 +50,14 @@ class Regression(object):
         '''
         return (model - label) * feature
 
+    @staticmethod
+    def curvature(model):
+        '''Calculate the weight of a row in the Hessian used by
+        GradientDescent.newton.
+        number --> number
+        '''
+        return numpy.ones_like(model)
+
     class LogisticRegression(object):
 
         def __init__(self):
@@ -55,6 +78,14 @@ class Regression(object):
             return model * (1 - model) * Regression.gradient(model, feature,
                                                              label)
 
+        @staticmethod
+        def curvature(model):
+            '''Calculate the weight of a row in the Hessian of the log-loss
+            used by GradientDescent.newton.
+            number --> number
+            '''
+            return model * (1 - model)
+
 
 ###############################################################################
 
@@ -69,13 +100,17 @@ class GradientDescent(object):
         '''Gradient descend new weights from a single datapoint.
 
         weights      -- list of weights
-        datapoint    -- DataPoint instance
+        datapoint    -- DataPoint or dataset.DataRow instance
         score        -- function [weights features --> score]
         gradient     -- function [score feature label --> gradient]
         learningrate -- learning rate parameter (lambda)
 
         '''
         s = score(weights, datapoint.features)
+        if isinstance(datapoint.features, numpy.ndarray):
+            # update every weight at once from the row's feature array
+            return (numpy.asarray(weights) - learningrate * gradient(
+                s, datapoint.features, datapoint.label)).tolist()
         return [w - learningrate * gradient(s, datapoint.features[j],
                                             datapoint.label) \
                 for j, w in enumerate(weights)]
@@ -88,77 +123,528 @@ class GradientDescent(object):
         through the datapoints before returning.
 
         weights      -- list of weights
-        datapoints   -- list of DataPoint instances
+        datapoints   -- list of DataPoint instances or a dataset.DataMatrix
+                        (or SparseDataMatrix, see stochastic_sparse)
         score        -- function [weights features --> score]
         gradient     -- function [score feature label --> gradient]
         learningrate -- learning rate parameter (lambda)
 
         '''
+        if isinstance(datapoints, dataset.SparseDataMatrix):
+            return GradientDescent.stochastic_sparse(
+                weights, datapoints, score, gradient, learningrate)
         newweights = weights[:]
         for dp in datapoints:
             newweights = GradientDescent.stochastic(newweights, dp, score,
                                                     gradient, learningrate)
         return newweights
 
+    @staticmethod
+    def stochastic_sparse(weights, datapoints, score, gradient, learningrate):
+        '''Gradient descend new weights from a dataset.SparseDataMatrix, as
+        stochastic_pass does, touching only the nonzero feature values.
+
+        Each row is scored from its nonzero values and the weights of their
+        features alone, and only those weights are updated, since the
+        gradient of a weight is zero where its feature is. This relies on
+        score depending on the features only through their dot product with
+        the weights, and on gradient being linear in its feature argument,
+        as both are for both kinds of regression. There is no penalty
+        shrinking every weight on each update, so no weights need updating
+        lazily.
+
+        '''
+        newweights = numpy.array(weights, dtype=numpy.float64)
+        features = datapoints.features
+        with numpy.errstate(over='ignore', invalid='ignore'):
+            for i, label in enumerate(datapoints.labels.tolist()):
+                indices, values = features.row(i)
+                s = score(newweights[indices], values)
+                newweights[indices] -= learningrate * gradient(s, values,
+                                                               label)
+        return newweights.tolist()
+
+    @staticmethod
+    def stochastic_stream(weights, chunks, score, gradient, learningrate,
+                          transform=None):
+        '''Gradient descend new weights from a stream of datapoints.
+
+        Like stochastic_pass, but the datapoints come from an iterable of
+        dataset.DataMatrix chunks (eg: dataset.iterfile), so only one chunk
+        need be in memory at a time. The training RMSE is estimated in the
+        same pass from the score each datapoint gets just before its update.
+        Return a tuple of the new weights, that estimate and the number of
+        datapoints. The estimate is nan if there were no datapoints.
+
+        weights      -- list of weights
+        chunks       -- iterable of dataset.DataMatrix instances
+        score        -- function [weights features --> score]
+        gradient     -- function [score feature label --> gradient]
+        learningrate -- learning rate parameter (lambda)
+        transform    -- function [[[number]] --> [[number]]] applied to the
+                        features of each chunk first, as for
+                        NormalEquations.fit
+
+        '''
+        newweights = numpy.array(weights, dtype=numpy.float64)
+        sse = 0.0
+        count = 0
+        with numpy.errstate(over='ignore', invalid='ignore'):
+            for chunk in chunks:
+                rows = chunk.features
+                if transform is not None:
+                    rows = transform(rows)
+                for features, label in zip(rows, chunk.labels.tolist()):
+                    s = score(newweights, features)
+                    sse += (s - label) ** 2
+                    newweights -= learningrate * gradient(s, features, label)
+                count += len(chunk)
+        if not count:
+            return newweights.tolist(), float('nan'), count
+        return newweights.tolist(), float((sse / count) ** 0.5), count
+
+    @staticmethod
+    def sumgradient(weights, features, labels, score, gradient):
+        '''Sum the gradients of each weight over rows of a feature matrix.
+
+        The rows are scored in one matrix-vector product and the gradients
+        summed in another. This relies on gradient being linear in its
+        feature argument, as it is for both kinds of regression.
+
+        weights      -- list or array of weights
+        features     -- 2-D array or dataset.SparseMatrix with one row of
+                        features per datapoint
+        labels       -- array with one label per datapoint
+        score        -- function [weights features --> score]
+        gradient     -- function [score feature label --> gradient]
+
+        '''
+        with numpy.errstate(over='ignore'):
+            scores = score(weights, features)
+        return GradientDescent.sumscored(features, labels, scores, gradient)
+
+    @staticmethod
+    def sumscored(features, labels, scores, gradient):
+        '''Sum the gradients of each weight over rows of a feature matrix
+        given the rows' scores, as sumgradient does after scoring them.
+        '''
+        if isinstance(features, dataset.SparseMatrix):
+            return features.tdot(gradient(scores, 1.0, labels))
+        return features.T.dot(gradient(scores, 1.0, labels))
+
     @staticmethod
     def batch(weights, datapoints, score, gradient, learningrate):
         '''Gradient-descend new weights from a list of datapoints.
 
         weights      -- list of weights
-        datapoints   -- list of DataPoint instances
+        datapoints   -- list of DataPoint instances or a dataset.DataMatrix
         score        -- function [weights features --> score]
         gradient     -- function [score feature label --> gradient]
         learningrate -- learning rate parameter (lambda)
 
         '''
-        return [w - learningrate * sum([gradient(score(weights, dp.features),
-                                                 dp.features[j],
-                                                 dp.label) \
-                                        for dp in datapoints]) \
-                for j, w in enumerate(weights)]
+        if not isinstance(datapoints, dataset.DataMatrix):
+            datapoints = dataset.DataMatrix.fromdatapoints(datapoints)
+        sums = GradientDescent.sumgradient(weights, datapoints.features,
+                                           datapoints.labels, score, gradient)
+        return (numpy.asarray(weights) - learningrate * sums).tolist()
+
+    @staticmethod
+    def batch_scored(weights, datapoints, scores, gradient, learningrate):
+        '''Gradient-descend new weights as batch does, given the scores of
+        weights over a dataset.DataMatrix instead of the score function.
+        '''
+        sums = GradientDescent.sumscored(datapoints.features,
+                                         datapoints.labels, scores, gradient)
+        return (numpy.asarray(weights) - learningrate * sums).tolist()
+
+    @staticmethod
+    def minibatch(size, shuffle=False, seed=None):
+        '''Make a gdfunction which descends once per mini-batch of datapoints.
+
+        The datapoints are split into consecutive batches of size rows, and
+        each batch's gradients are summed as in batch. A size of 1 is thus
+        stochastic_pass, and a size of at least the datapoint count is batch.
+        With shuffle, the datapoints are put in a new random order before
+        every pass; seed makes that sequence of orders repeatable.
+
+        size         -- number of datapoints per weight update
+        shuffle      -- whether to reorder the datapoints on every pass
+        seed         -- seed for the random orders (eg: RANDOMSEED)
+
+        '''
+        rng = random.Random(seed)
+        def minibatch(weights, datapoints, score, gradient, learningrate):
+            if not isinstance(datapoints, dataset.DataMatrix):
+                datapoints = dataset.DataMatrix.fromdatapoints(datapoints)
+            features, labels = datapoints.features, datapoints.labels
+            if shuffle:
+                order = range(len(datapoints))
+                rng.shuffle(order)
+                features, labels = features[order], labels[order]
+            newweights = numpy.array(weights, dtype=numpy.float64)
+            for start in xrange(0, len(labels), size):
+                newweights -= learningrate * GradientDescent.sumgradient(
+                    newweights, features[start:start + size],
+                    labels[start:start + size], score, gradient)
+            return newweights.tolist()
+        minibatch.rng = rng # see loop
+        return minibatch
+
+    @staticmethod
+    def newton(regression, ridge=1e-8):
+        '''Make a gdfunction which takes Newton steps for a regression.
+
+        Each pass solves (X'CX + ridge * I) d = X'r, where X is the feature
+        matrix, r the residuals (score - label) of the rows and C their
+        curvature (see Regression.curvature), and descends to weights -
+        learningrate * d. For Regression this is Newton's method for the
+        squared error, which reaches the least squares weights in a single
+        pass with a learning rate of 1. For LogisticRegression it is
+        iteratively reweighted least squares: Newton's method for the
+        log-loss, whose minimum is usually near that of the squared error
+        which the loop judges passes by. The gradient argument is not used.
+
+        regression -- Regression or LogisticRegression
+        ridge      -- added to the curvature of each weight but the phantom
+                      one, to keep saturated rows from making the system
+                      singular
+
+        Sparse data has its X'CX built from the nonzero values by
+        dataset.SparseMatrix.gram. Either way X'CX is a dense square matrix
+        of the width, so this suits data with up to a few thousand features.
+
+        '''
+        def newton_scored(weights, datapoints, scores, gradient,
+                          learningrate):
+            features = datapoints.features
+            curvature = regression.curvature(scores)
+            residuals = scores - datapoints.labels
+            if isinstance(features, dataset.SparseMatrix):
+                hessian = features.gram(curvature)
+                sums = features.tdot(residuals)
+            else:
+                hessian = features.T.dot(
+                    features * curvature[:, numpy.newaxis])
+                sums = features.T.dot(residuals)
+            step = LeastSquares.cholesky(hessian, sums, ridge)
+            return (numpy.asarray(weights) -
+                    learningrate * numpy.asarray(step)).tolist()
+        def newton(weights, datapoints, score, gradient, learningrate):
+            if not isinstance(datapoints, dataset.DataMatrix):
+                datapoints = dataset.DataMatrix.fromdatapoints(datapoints)
+            with numpy.errstate(over='ignore'):
+                scores = score(weights, datapoints.features)
+            return newton_scored(weights, datapoints, scores, gradient,
+                                 learningrate)
+        newton.scored = newton_scored # see loop
+        return newton
+
+    @staticmethod
+    def lbfgs(memory=10):
+        '''Make a gdfunction which takes limited-memory BFGS steps.
+
+        The summed gradient of each pass is turned into a step by an
+        estimate of the inverse Hessian, made from the changes in weights
+        and in gradient over the last memory accepted passes, and the new
+        weights are weights - learningrate * step. The first pass has no
+        estimate, so its step is the gradient scaled to a length of 1. A
+        learning rate of 1 is the natural step, so (1.0, lambda lr: lr/2)
+        suits it: the loop then halves the step on any pass which makes the
+        error worse.
+
+        A gdfunction remembers the passes it has made, so make a new one
+        for every learning run.
+
+        '''
+        # changes in weights and in gradient over recent accepted passes
+        pairs = collections.deque(maxlen=memory)
+        last = {} # weights and gradient of the previous pass
+        def lbfgs_scored(weights, datapoints, scores, gradient,
+                         learningrate):
+            weights = numpy.array(weights, dtype=numpy.float64)
+            g = GradientDescent.sumscored(datapoints.features,
+                                          datapoints.labels, scores, gradient)
+            if last and not numpy.array_equal(last['weights'], weights):
+                # the previous pass was accepted
+                s = weights - last['weights']
+                y = g - last['gradient']
+                if s.dot(y) > 0:
+                    pairs.append((s, y))
+            last['weights'], last['gradient'] = weights, g
+            # the two-loop recursion
+            step = g.copy()
+            alphas = []
+            for s, y in reversed(pairs):
+                rho = 1.0 / y.dot(s)
+                alpha = rho * s.dot(step)
+                step -= alpha * y
+                alphas.append((rho, alpha, s, y))
+            if pairs:
+                s, y = pairs[-1]
+                step *= s.dot(y) / y.dot(y)
+            else:
+                # no estimate yet: a step of unit length down the gradient
+                step /= max(numpy.sqrt(step.dot(step)), 1e-12)
+            for rho, alpha, s, y in reversed(alphas):
+                step += (alpha - rho * y.dot(step)) * s
+            return (weights - learningrate * step).tolist()
+        def lbfgs(weights, datapoints, score, gradient, learningrate):
+            if not isinstance(datapoints, dataset.DataMatrix):
+                datapoints = dataset.DataMatrix.fromdatapoints(datapoints)
+            with numpy.errstate(over='ignore'):
+                scores = score(weights, datapoints.features)
+            return lbfgs_scored(weights, datapoints, scores, gradient,
+                                learningrate)
+        lbfgs.scored = lbfgs_scored # see loop
+        return lbfgs
+
+    @staticmethod
+    def stateful(name, size, update):
+        '''Make a gdfunction which descends once per mini-batch like
+        minibatch, taking each step with update, which may keep state
+        across batches and passes (eg: a velocity).
+
+        name   -- name of the gdfunction
+        size   -- number of datapoints per weight update; 1 for stochastic
+        update -- function [state weights gradient learningrate --> weights]
+                  which may change state, a dict which starts empty
+
+        The state a pass starts with is kept. If the next pass starts from
+        the weights this pass returned, the loop accepted them and the
+        state carries on; otherwise they were rejected, and the next pass
+        starts from the kept state again, as the weights do. So make a new
+        gdfunction for every learning run.
+
+        '''
+        saved = {'start': {}, 'end': {}, 'weights': None}
+        def copy(state):
+            return dict((k, numpy.copy(v)) for k, v in state.iteritems())
+        def stateful(weights, datapoints, score, gradient, learningrate):
+            if not isinstance(datapoints, dataset.DataMatrix):
+                datapoints = dataset.DataMatrix.fromdatapoints(datapoints)
+            features, labels = datapoints.features, datapoints.labels
+            newweights = numpy.array(weights, dtype=numpy.float64)
+            if saved['weights'] is not None and \
+               numpy.array_equal(saved['weights'], newweights):
+                saved['start'] = saved['end']
+            state = copy(saved['start'])
+            for start in xrange(0, len(labels), size):
+                newweights = update(state, newweights,
+                                    GradientDescent.sumgradient(
+                                        newweights,
+                                        features[start:start + size],
+                                        labels[start:start + size], score,
+                                        gradient),
+                                    learningrate)
+            saved['end'], saved['weights'] = state, newweights.copy()
+            return newweights.tolist()
+        stateful.__name__ = name
+        return stateful
+
+    @staticmethod
+    def momentum(beta=0.9, size=1):
+        '''Make a gdfunction which descends stochastically (or per
+        mini-batch of size datapoints) with momentum: each step is the
+        gradient plus beta times the previous step. See stateful for how
+        rejected passes are undone.
+        '''
+        def update(state, weights, g, learningrate):
+            velocity = beta * state.get('velocity', 0.0) + g
+            state['velocity'] = velocity
+            return weights - learningrate * velocity
+        return GradientDescent.stateful('momentum', size, update)
+
+    @staticmethod
+    def adam(beta1=0.9, beta2=0.999, epsilon=1e-8, size=1):
+        '''Make a gdfunction which descends stochastically (or per
+        mini-batch of size datapoints) by Adam: each weight steps by a
+        running mean of its gradient divided by the root of a running mean
+        of its squared gradient, so the learning rate is about the size of
+        each step whatever the scale of the gradient. See stateful for how
+        rejected passes are undone.
+        '''
+        def update(state, weights, g, learningrate):
+            t = state.get('t', 0) + 1
+            m = beta1 * state.get('m', 0.0) + (1 - beta1) * g
+            v = beta2 * state.get('v', 0.0) + (1 - beta2) * g * g
+            state['t'], state['m'], state['v'] = t, m, v
+            return weights - learningrate * (m / (1 - beta1 ** t)) / \
+                   (numpy.sqrt(v / (1 - beta2 ** t)) + epsilon)
+        return GradientDescent.stateful('adam', size, update)
+
+    @staticmethod
+    def error(weights, datapoints, score):
+        '''Calculate the root mean squared error of weights over datapoints.
+
+        Raises OverflowError if the error is not a finite number.
+
+        weights      -- list of weights
+        datapoints   -- list of DataPoint instances or a dataset.DataMatrix
+        score        -- function [weights features --> score]
+
+        '''
+        if not isinstance(datapoints, dataset.DataMatrix):
+            return stats.rmse(
+                [score(weights, dp.features) for dp in datapoints],
+                [dp.label for dp in datapoints])
+        with numpy.errstate(over='ignore', invalid='ignore'):
+            residuals = score(weights, datapoints.features) - datapoints.labels
+            error = float(numpy.sqrt(numpy.mean(residuals ** 2)))
+        if not numpy.isfinite(error):
+            raise OverflowError('training error is not finite')
+        return error
 
     @staticmethod
     def loop(weights, training, score, gradient, learningrate, reducelr,
-             gdfunction, maxratio):
+             gdfunction, maxratio, checkpointfile=None, every=1,
+             callback=None):
         '''A gradient descent loop for either batch or stochastic_pass.
 
-        weights      -- initial weight vector
-        training     -- list of DataPoint instances to train on
-        score        -- function [weights features --> score]
-        gradient     -- function [score feature label --> gradient]
-        learningrate -- learning rate parameter (lambda)
-        reducelr     -- function [number --> number] to reduce learning rate
-        gdfunction   -- function with a signature like GradientDescent.batch
-        maxraio      -- maximum newerror:olderror ratio before stopping
+        weights        -- initial weight vector
+        training       -- list of DataPoint instances or a dataset.DataMatrix
+        score          -- function [weights features --> score]
+        gradient       -- function [score feature label --> gradient]
+        learningrate   -- learning rate parameter (lambda)
+        reducelr       -- function [number --> number] to reduce learning
+                          rate; learning stops when it leaves the rate
+                          unchanged
+        gdfunction     -- function with a signature like GradientDescent.batch
+        maxraio        -- maximum newerror:olderror ratio before stopping
+        checkpointfile -- file name to save a checkpoint.Checkpoint to, or
+                          None; if the file exists, learning resumes from it
+                          instead of from weights and learningrate
+        every          -- number of passes between checkpoints
+        callback       -- function [event dict -->] called with each
+                          training event (see telemetry); defaults to
+                          telemetry.printer()
+
+        A checkpoint records the random state of gdfunction.rng if it has
+        one (eg: from minibatch) and of the random module otherwise, so a
+        resumed loop shuffles as the interrupted one would have. Nothing
+        else a gdfunction keeps between passes is recorded: a resumed lbfgs
+        starts without its history, and a resumed momentum or adam (see
+        stateful) with no velocity or moments, so each takes its first
+        steps again as it did at the very start. Likewise,
+        the training error is found by gdfunction.error if it has one (eg:
+        from parallel.Shards.batch), with the signature of error, and by
+        error otherwise.
+
+        Otherwise, for a dataset.DataMatrix, the scores found for the
+        training error are kept in a ScoreCache. If gdfunction has a
+        scored attribute (as batch does), it is called in its place with
+        the cached scores of the weights instead of score, so each pass
+        scores the training data once rather than twice.
+
+        '''
+        if callback is None:
+            callback = telemetry.printer()
+        if checkpointfile is None:
+            for weights, error, learningrate, finished in \
+                    GradientDescent.passes(weights, training, score, gradient,
+                                           learningrate, reducelr, gdfunction,
+                                           maxratio, callback=callback):
+                pass
+            return weights
+
+        # resume or start
+        rng = getattr(gdfunction, 'rng', random)
+        if os.path.exists(checkpointfile):
+            state = checkpoint.Checkpoint.load(checkpointfile)
+            callback({'event': 'resume', 'checkpoint': repr(state)})
+            rng.setstate(state.rngstate)
+            if state.finished:
+                return state.weights
+        else:
+            # the initial error is found by passes, and recorded from its
+            # event
+            state = checkpoint.Checkpoint(weights, learningrate, [], 0,
+                                          rng.getstate())
+        def record(event):
+            if event['event'] == 'initial':
+                state.errors.append(event['error'])
+            callback(event)
+
+        # loop, saving every few passes and at the end
+        for weights, error, learningrate, finished in GradientDescent.passes(
+                state.weights, training, score, gradient, state.learningrate,
+                reducelr, gdfunction, maxratio,
+                state.errors[-1] if state.errors else None, record,
+                state.passes):
+            state.weights, state.learningrate = weights, learningrate
+            state.errors.append(error)
+            state.passes += 1
+            state.finished = finished
+            if finished or state.passes % every == 0:
+                state.rngstate = rng.getstate()
+                state.save(checkpointfile)
+        return state.weights
+
+    @staticmethod
+    def passes(weights, training, score, gradient, learningrate, reducelr,
+               gdfunction, maxratio, error=None, callback=None, count=0):
+        '''The gradient descent loop of loop, one pass at a time.
+
+        Takes the same arguments as loop, plus the training error of weights
+        if it is already known and the number of passes already made (eg:
+        before a checkpoint), which the pass numbers in events follow on
+        from. After every pass, accepted or not, yields a tuple of the
+        weights accepted so far, their training error, the learning rate for
+        the next pass and whether learning has finished. Calling again with
+        those values carries on where it left off.
 
         '''
-        INDENT = '  '
-        print INDENT * 2 + 'Initial learning rate:', learningrate
+        if callback is None:
+            callback = telemetry.printer()
+        callback({'event': 'start', 'learningrate': learningrate})
+        if hasattr(gdfunction, 'error') or \
+           not isinstance(training, dataset.DataMatrix):
+            cache = None
+            errorfunction = getattr(gdfunction, 'error',
+                                    GradientDescent.error)
+        else:
+            # the weights' scores, for the error and then the next pass
+            cache = ScoreCache(training, score)
+            errorfunction = lambda weights, training, score: \
+                            cache.error(weights)
 
         # initialize the error
-        error = stats.rmse(
-            [score(weights, dp.features) for dp in training],
-            [dp.label for dp in training])
-        print INDENT * 2 + 'Initial Training RMSE:', error
+        if error is None:
+            begun = time.time()
+            error = errorfunction(weights, training, score)
+            callback({'event': 'initial', 'error': error,
+                      'errortime': time.time() - begun,
+                      'rows': len(training)})
 
         # loop
         while True:
+            count += 1
 
             # calculate new weights & error
-            newweights = gdfunction(weights, training, score, gradient,
-                                    learningrate)
+            begun = time.time()
+            if cache is not None and hasattr(gdfunction, 'scored'):
+                newweights = gdfunction.scored(weights, training,
+                                               cache.scores(weights),
+                                               gradient, learningrate)
+            else:
+                newweights = gdfunction(weights, training, score, gradient,
+                                        learningrate)
+            graded = time.time()
             try:
-                newerror = stats.rmse(
-                    [score(newweights, dp.features) for dp in training],
-                    [dp.label for dp in training])
+                newerror = errorfunction(newweights, training, score)
             except OverflowError:
+                reported = None
                 newerror = error + 1
-                print INDENT * 3 + 'Training RMSE: Overflow'
             else:
-                if newerror <= error:
-                    print INDENT * 2 + 'Training RMSE: v', newerror
-                else:
-                    print INDENT * 3 + 'Training RMSE: ^', newerror
+                reported = newerror
+            ended = time.time()
+            callback({'event': 'pass', 'pass': count,
+                      'learningrate': learningrate, 'error': reported,
+                      'accepted': newerror <= error,
+                      'gradienttime': graded - begun,
+                      'errortime': ended - graded,
+                      'rows': len(training),
+                      'rowspersec': len(training) / max(ended - begun, 1e-9)})
 
             # figure out what to do next
             if newerror <= error:
@@ -168,25 +654,348 @@ class GradientDescent(object):
                 weights = newweights
                 # do we stop?
                 if ratio > maxratio:
-                    print INDENT * 2 + 'Finished learning; error ratio:',
-                    print ratio, '>', maxratio
+                    callback({'event': 'finish', 'pass': count,
+                              'reason': 'ratio', 'ratio': ratio,
+                              'maxratio': maxratio})
+                    yield weights, error, learningrate, True
+                    return
+            else:
+                # error went up; retry with a smaller lambda
+                newlr = reducelr(learningrate)
+                if newlr == learningrate:
+                    # the same pass would only be made again
+                    callback({'event': 'finish', 'pass': count,
+                              'reason': 'learningrate',
+                              'learningrate': learningrate})
+                    yield weights, error, learningrate, True
+                    return
+                learningrate = newlr
+                callback({'event': 'retry', 'pass': count,
+                          'learningrate': learningrate})
+
+            yield weights, error, learningrate, False
+
+    @staticmethod
+    def streamloop(weights, readchunks, score, gradient, learningrate,
+                   reducelr, maxratio, callback=None, transform=None):
+        '''A gradient descent loop for stochastic_stream.
+
+        Passes are accepted, retried and stopped as in loop, but judged by
+        the training RMSE which stochastic_stream estimates during the pass
+        itself, so the training data is read exactly once per pass. The first
+        pass is always accepted. Pass events count all of the time as
+        gradienttime, since the error is found along the way.
+
+        weights      -- initial weight vector
+        readchunks   -- function [--> iterable of dataset.DataMatrix] which
+                        starts a new pass through the training data
+        score        -- function [weights features --> score]
+        gradient     -- function [score feature label --> gradient]
+        learningrate -- learning rate parameter (lambda)
+        reducelr     -- function [number --> number] to reduce learning rate;
+                        learning stops when it leaves the rate unchanged
+        maxraio      -- maximum newerror:olderror ratio before stopping
+        callback     -- as for loop
+        transform    -- as for stochastic_stream, eg: to z-score the raw
+                        chunks of dataset.iterfile and add the phantom
+                        feature as a predictor.Predictor with a scaler does
+
+        A pass over no datapoints has a training RMSE of nan, and so is
+        never accepted.
+
+        '''
+        if callback is None:
+            callback = telemetry.printer()
+        callback({'event': 'start', 'learningrate': learningrate})
+
+        # loop
+        error = None
+        count = 0
+        while True:
+            count += 1
+
+            # calculate new weights & error
+            begun = time.time()
+            newweights, newerror, rows = GradientDescent.stochastic_stream(
+                weights, readchunks(), score, gradient, learningrate,
+                transform)
+            ended = time.time()
+            finite = bool(numpy.isfinite(newerror))
+            accepted = finite and (error is None or newerror <= error)
+            callback({'event': 'pass', 'pass': count,
+                      'learningrate': learningrate,
+                      'error': newerror if finite else None,
+                      'accepted': accepted,
+                      'gradienttime': ended - begun, 'errortime': 0.0,
+                      'rows': rows,
+                      'rowspersec': rows / max(ended - begun, 1e-9)})
+
+            # figure out what to do next
+            if accepted and error is None:
+                # first pass; accept error and weights
+                error = newerror
+                weights = newweights
+            elif accepted:
+                ratio = newerror / error
+                # error went down; accept error and weights
+                error = newerror
+                weights = newweights
+                # do we stop?
+                if ratio > maxratio:
+                    callback({'event': 'finish', 'pass': count,
+                              'reason': 'ratio', 'ratio': ratio,
+                              'maxratio': maxratio})
                     break
             else:
                 # error went up; retry with a smaller lambda
-                learningrate = reducelr(learningrate)
-                print INDENT * 3 + 'Retrying with learning rate:', learningrate
+                newlr = reducelr(learningrate)
+                if newlr == learningrate:
+                    # the same pass would only be made again
+                    callback({'event': 'finish', 'pass': count,
+                              'reason': 'learningrate',
+                              'learningrate': learningrate})
+                    break
+                learningrate = newlr
+                callback({'event': 'retry', 'pass': count,
+                          'learningrate': learningrate})
 
         # done
         return weights
 
 
+GradientDescent.batch.scored = GradientDescent.batch_scored # see loop
+
+
+class ScoreCache(object):
+    '''The scores of the weights a gradient descent loop last accepted and
+    last tried, over its training data.
+
+    training -- dataset.DataMatrix
+    score    -- function [weights features --> score]
+
+    Asking for the scores of either set of weights again costs nothing, so
+    after a pass is accepted the next pass need not score the data again,
+    and after one is rejected the retry need not either. Weights are
+    matched by value, so changed weights are never given stale scores.
+
+    '''
+
+    def __init__(self, training, score, size=2):
+        self.training = training
+        self.score = score
+        self.size = size # sets of weights whose scores are kept
+        self.entries = [] # (weights, scores), most recently used first
+        self.hits = 0
+        self.misses = 0
+
+    def scores(self, weights):
+        '''Return the scores of weights over the training data.'''
+        weights = numpy.asarray(weights, dtype=numpy.float64)
+        for i, (cached, scores) in enumerate(self.entries):
+            if numpy.array_equal(cached, weights):
+                self.hits += 1
+                self.entries.insert(0, self.entries.pop(i))
+                return scores
+        self.misses += 1
+        with numpy.errstate(over='ignore', invalid='ignore'):
+            scores = self.score(weights, self.training.features)
+        self.entries.insert(0, (weights.copy(), scores))
+        del self.entries[self.size:]
+        return scores
+
+    def error(self, weights):
+        '''Calculate the root mean squared error of weights, as
+        GradientDescent.error does.
+        '''
+        with numpy.errstate(over='ignore', invalid='ignore'):
+            residuals = self.scores(weights) - self.training.labels
+            error = float(numpy.sqrt(numpy.mean(residuals ** 2)))
+        if not numpy.isfinite(error):
+            raise OverflowError('training error is not finite')
+        return error
+
+    def __repr__(self):
+        return '{}({} hits, {} misses)'.format(self.__class__.__name__,
+                                               self.hits, self.misses)
+
+
 ###############################################################################
 
 
-def main2(gdname, gdfunction, training, regression, learningrate):
-    '''Perform gradient descent with a learner and analyze the results.'''
+class LeastSquares(object):
+    '''Solves for the weights of Regression directly instead of descending.
+
+    The weights minimize the sum of squared errors over the training data,
+    plus ridge times the sum of the squared weights other than the first
+    (the phantom feature's, which is not penalized). They are the solution
+    w of the normal equations
+
+        (X'X + ridge * I) w = X'y
+
+    for the feature matrix X and label vector y, found in one step.
+
+    '''
+
+    def __init__(self):
+        raise NotImplementedError
+
+    @staticmethod
+    def penalty(width, ridge):
+        '''Return the ridge term added to X'X: ridge on the diagonal, except
+        for the phantom feature's entry.
+        '''
+        penalty = ridge * numpy.eye(width)
+        penalty[0, 0] = 0.0
+        return penalty
+
+    @staticmethod
+    def substitute(t, b, lower=True):
+        '''Solve t x = b for x by substitution, where t is a lower (or, if
+        not lower, upper) triangular matrix. Return an array.
+
+        Each unknown costs one dot product with those already found, so the
+        whole solve is about n * n / 2 multiplications, where a general
+        solve first spends about n * n * n / 3 factoring t again.
+
+        '''
+        n = len(b)
+        x = numpy.zeros(n)
+        for i in (xrange(n) if lower else xrange(n - 1, -1, -1)):
+            known = slice(0, i) if lower else slice(i + 1, n)
+            x[i] = (b[i] - t[i, known].dot(x[known])) / t[i, i]
+        return x
+
+    @staticmethod
+    def cholesky(xtx, xty, ridge=0.0):
+        '''Solve the normal equations given X'X and X'y. Return a list of
+        weights.
+
+        X'X + ridge * I is factored as L L' by Cholesky decomposition, which
+        is half the work of the LU factoring of a general solve, and the
+        weights then found by substitution through L and L'. If it is
+        singular, as when a feature is a combination of the others and ridge
+        is 0, the minimum norm solution is found by numpy.linalg.lstsq
+        instead.
+
+        '''
+        a = xtx + LeastSquares.penalty(len(xty), ridge)
+        try:
+            l = numpy.linalg.cholesky(a)
+        except numpy.linalg.LinAlgError:
+            return numpy.linalg.lstsq(a, xty, rcond=None)[0].tolist()
+        return LeastSquares.substitute(
+            l.T, LeastSquares.substitute(l, xty), lower=False).tolist()
+
+    @staticmethod
+    def solve(training, ridge=0.0, method='cholesky'):
+        '''Solve for the weights of Regression on training data. Return a
+        list of weights.
+
+        training -- dataset.DataMatrix, already preprocessed
+        ridge    -- regularization parameter; 0 for ordinary least squares
+        method   -- 'cholesky' to solve the normal equations as cholesky
+                    does, which is fastest; or 'qr' to factor X itself,
+                    which is more accurate when features are nearly
+                    collinear, since forming X'X squares its condition
+                    number
+
+        If X is rank-deficient, as when a feature is a combination of the
+        others and ridge is 0, R has a diagonal entry which is zero but for
+        rounding, and substituting would divide by it; the minimum norm
+        solution is found by numpy.linalg.lstsq instead, as by cholesky.
+
+        '''
+        x = numpy.asarray(training.features, dtype=numpy.float64)
+        y = numpy.asarray(training.labels, dtype=numpy.float64)
+        if method == 'cholesky':
+            return LeastSquares.cholesky(x.T.dot(x), x.T.dot(y), ridge)
+        if method != 'qr':
+            raise ValueError('unknown least squares method ' + repr(method))
+        if ridge:
+            # ridge is least squares with sqrt(ridge) * I as extra rows
+            x = numpy.vstack((x, numpy.sqrt(LeastSquares.penalty(x.shape[1],
+                                                                 ridge))))
+            y = numpy.concatenate((y, numpy.zeros(x.shape[1])))
+        q, r = numpy.linalg.qr(x)
+        diagonal = numpy.abs(numpy.diag(r))
+        if diagonal.min() <= diagonal.max() * max(x.shape) * \
+           numpy.finfo(numpy.float64).eps:
+            return numpy.linalg.lstsq(x, y, rcond=None)[0].tolist()
+        return LeastSquares.substitute(r, q.T.dot(y), lower=False).tolist()
+
+
+class NormalEquations(object):
+    '''Accumulates X'X and X'y for LeastSquares a chunk of rows at a time.
+
+    width -- number of features in each row, including the phantom one
+
+    Only a width by width matrix is kept, however many rows are added, so
+    training data which does not fit in memory can be streamed through
+    update (eg: from dataset.iterfile). Accumulators filled separately, eg:
+    by worker processes each given a share of the chunks, are combined by
+    merge, since both sums are sums over rows.
+
+    '''
+
+    def __init__(self, width):
+        self.count = 0 # rows so far
+        self.xtx = numpy.zeros((width, width))
+        self.xty = numpy.zeros(width)
+
+    @classmethod
+    def fit(cls, chunks, transform=None):
+        '''Return a NormalEquations with every row of an iterable of
+        dataset.DataMatrix chunks added.
+
+        transform -- function [[[number]] --> [[number]]] applied to the
+                     features of each chunk first, eg: to z-score them and
+                     add the phantom feature as a predictor.Predictor with a
+                     scaler does
 
-    # learning rate
+        '''
+        equations = None
+        for chunk in chunks:
+            features = chunk.features
+            if transform is not None:
+                features = transform(features)
+            if equations is None:
+                equations = cls(features.shape[1])
+            equations.update(features, chunk.labels)
+        return equations
+
+    def update(self, features, labels):
+        '''Add the rows of a feature matrix and their labels.'''
+        features = numpy.asarray(features, dtype=numpy.float64)
+        self.xtx += features.T.dot(features)
+        self.xty += features.T.dot(numpy.asarray(labels,
+                                                 dtype=numpy.float64))
+        self.count += len(features)
+
+    def merge(self, other):
+        '''Add the sums of another NormalEquations of the same width.'''
+        self.xtx += other.xtx
+        self.xty += other.xty
+        self.count += other.count
+
+    def solve(self, ridge=0.0):
+        '''Solve for the weights as LeastSquares.cholesky does.'''
+        return LeastSquares.cholesky(self.xtx, self.xty, ridge)
+
+    def __repr__(self):
+        return '{}({} features, {} rows)'.format(self.__class__.__name__,
+                                                 len(self.xty), self.count)
+
+
+###############################################################################
+
+
+def learningrates(learningrate):
+    '''Split a learning rate into (initial rate, reducing function, name).
+
+    learningrate -- number to keep the rate fixed, or tuple of an initial
+                    rate and a function [number --> number] to reduce it
+
+    '''
     try:
         initiallr, reducelr = learningrate
         suffix = 'dynamic' + str(initiallr)
@@ -194,28 +1003,56 @@ def main2(gdname, gdfunction, training, regression, learningrate):
         initiallr = learningrate
         reducelr = lambda x: x
         suffix = initiallr
+    return initiallr, reducelr, suffix
 
-    # learn
-    weights = GradientDescent.loop(
-        len(training[0].features) * [0.0],
+
+def learn(gdfunction, training, regression, learningrate,
+          checkpointfile=None, callback=None):
+    '''Train a regression by gradient descent from zero weights.
+
+    checkpointfile -- as for GradientDescent.loop; learning resumes from it
+                      if it exists
+    callback       -- as for GradientDescent.loop
+
+    '''
+    initiallr, reducelr, suffix = learningrates(learningrate)
+    return GradientDescent.loop(
+        training.width * [0.0],
         training,
         regression.model,
         regression.gradient,
         initiallr,
         reducelr,
         gdfunction,
-        0.99)
+        0.99,
+        checkpointfile,
+        callback=callback)
+
+
+def savemodel(path, weights, regression, fitted=None):
+    '''Save learned weights for a regression to path, for loadmodel.
+
+    fitted -- scaler.Scaler from preprocess, saved with the weights so that
+              the loaded predictor scores raw features; or None
+
+    '''
+    predictor.Predictor(weights, regression, fitted).save(path)
 
-    # test
-    terror = stats.rmse(
-        [regression.model(weights, dp.features) for dp in testing],
-        [dp.label for dp in testing])
-    print INDENT * 2 + 'Testing RMSE:', terror
+
+def loadmodel(path):
+    '''Load a model saved by savemodel. Return a predictor.Predictor.'''
+    return predictor.Predictor.load(path, REGRESSIONS)
+
+
+def evaluate(weights, testing, regression):
+    '''Return the testing RMSE, ROC data and AUC of learned weights.'''
+    terror = GradientDescent.error(weights, testing, regression.model)
 
     ## produce a result set
-    results = [resultset.DataResult(dp.label,
-                                    regression.model(weights, dp.features)) \
-               for dp in testing]
+    scores = predictor.Predictor(weights, regression).score(testing.features)
+    results = [resultset.DataResult(label, score) \
+               for label, score in zip(testing.labels.tolist(),
+                                       scores.tolist())]
 
 ##    ## find a good operating point
 ##    op = resultset.minerrop(results)
@@ -224,15 +1061,82 @@ def main2(gdname, gdfunction, training, regression, learningrate):
 ##    ## assign predictions
 ##    results = resultset.applyop(op, results)
 
-    ## output roc data
     roc = resultset.rocdata(results)
-    auc = resultset.auc(roc)
+    return terror, roc, resultset.auc(roc)
+
+
+def main2(gdname, gdfunction, training, regression, learningrate):
+    '''Perform gradient descent with a learner and analyze the results.'''
+
+    # learn
+    weights = learn(gdfunction, training, regression, learningrate)
+
+    # test
+    terror, roc, auc = evaluate(weights, testing, regression)
+    print INDENT * 2 + 'Testing RMSE:', terror
+
+    ## output roc data
+    suffix = learningrates(learningrate)[2]
     with open('{}-{}_lambda={}_auc={}'.format(regression.__name__, gdname,
                                        suffix, auc).lower(),
               mode='wb') as fd:
         for fpr, tpr in roc:
             fd.write('{}, {}\n'.format(fpr, tpr))
 
+    ## output the model
+    savemodel('{}-{}_lambda={}.model'.format(regression.__name__, gdname,
+                                             suffix).lower(),
+              weights, regression, fitted)
+
+
+###############################################################################
+
+
+def preprocess(data):
+    '''Z-score the feature values of a DataMatrix in place and add phantom
+    features. Return the scaler.Scaler fitted to the data, for scoring new
+    data the same way.
+
+    The features of a dataset.SparseDataMatrix are only divided by their
+    standard deviations, since subtracting their means would make every
+    zero nonzero; the phantom weight learns the offset instead. The scaler
+    returned for them does not center either.
+    '''
+    fitted = scaler.Scaler.fit(
+        data, center=not isinstance(data, dataset.SparseDataMatrix))
+    fitted.transform(data.features)
+    data.prepend(1.0)
+    return fitted
+
+
+def folds(count):
+    '''Roll row numbers 0..count-1 into FOLDCOUNT folds.'''
+    return [range(k, count, FOLDCOUNT) for k in xrange(FOLDCOUNT)]
+
+
+def holdout(folds, k):
+    '''Return the row numbers for testing on fold k and for training on the
+    other folds. The training rows are shuffled the same way each time.
+    '''
+    testing = folds[k]
+    training = []
+    [training.extend(f) for i, f in enumerate(folds) if i != k]
+    # randomize training, making the shuffle the same each time
+    random.Random(RANDOMSEED).shuffle(training)
+    return testing, training
+
+
+# the regressions which models can be saved for
+REGRESSIONS = (Regression, Regression.LogisticRegression)
+
+
+# the four learners: regression, gdfunction, learning rate
+LEARNERS = [(Regression, GradientDescent.stochastic_pass, 0.0001),
+            (Regression, GradientDescent.batch, (1.0, lambda lr: lr/10)),
+            (Regression.LogisticRegression, GradientDescent.stochastic_pass,
+             0.1),
+            (Regression.LogisticRegression, GradientDescent.batch, 0.01)]
+
 
 ###############################################################################
 
@@ -244,50 +1148,71 @@ if __name__ == '__main__':
     spambase.load()
     d = spambase.data
 
-    # zscore feature values
-    def pre(lon):
-        mu = stats.mean(lon)
-        sd = stats.stddev(stats.mvue(lon, mu))
-        return stats.zscore(lon, mu, sd)
-    dataset.applykernel(d, pre)
-
-    # insert phantom features
-    for dp in d:
-        dp.features = [1.0] + list(dp.features)
-
-    # roll into folds
-    folds = [[] for i in xrange(FOLDCOUNT)]
-    k = 0 # kurrent fold
-    for dp in d:
-        # add to the current fold & switch to the next fold
-        folds[k].append(dp)
-        k = (k + 1) % FOLDCOUNT
-
-    # unroll to testing & training
-    testing = folds[0]
-    training = []
-    [training.extend(f) for f in folds[1:]]
-    del folds
+    # zscore feature values & insert phantom features
+    fitted = preprocess(d)
 
-    # randomize testing
-    random.seed(RANDOMSEED) # make shuffle the same each time
-    random.shuffle(training)
+    # roll into folds & unroll to testing & training
+    testing, training = holdout(folds(len(d)), 0)
+    testing = d[testing]
+    training = d[training]
 
     print 'Testing count:', len(testing)
     print 'Training count:', len(training)
 
     # do the four learners
-    rates = [0.0001,
-             (1.0, lambda lr: lr/10),
-             0.1,
-             0.01]
-    for reg in (Regression, Regression.LogisticRegression):
-        print '== {} =='.format(reg.__name__)
-        for gdfunc in (GradientDescent.stochastic_pass, GradientDescent.batch):
-            print INDENT * 1 + '== {} Gradient Descent =='.format(
-                gdfunc.__name__.capitalize())
-            lr = rates.pop(0)
-            main2(gdfunc.__name__, gdfunc, training, reg, lr)
+    prev = None
+    for reg, gdfunc, lr in LEARNERS:
+        if reg is not prev:
+            print '== {} =='.format(reg.__name__)
+            prev = reg
+        print INDENT * 1 + '== {} Gradient Descent =='.format(
+            gdfunc.__name__.capitalize())
+        main2(gdfunc.__name__, gdfunc, training, reg, lr)
+
+    # plain regression needs no descent
+    print '== {} =='.format(Regression.__name__)
+    print INDENT * 1 + '== Least Squares =='
+    weights = LeastSquares.solve(training)
+    print INDENT * 2 + 'Training RMSE:', \
+          GradientDescent.error(weights, training, Regression.model)
+    terror, roc, auc = evaluate(weights, testing, Regression)
+    print INDENT * 2 + 'Testing RMSE:', terror
+    print INDENT * 2 + 'AUC:', auc
+
+    # the other optimizers, through the same loop; made afresh for each run
+    # since some keep state between passes
+    halving = (1.0, lambda lr: lr/2)
+    optimizers = [
+        (Regression, 'batch', lambda: GradientDescent.batch,
+         (1.0, lambda lr: lr/10)),
+        (Regression, 'newton', lambda: GradientDescent.newton(Regression),
+         halving),
+        (Regression, 'lbfgs', GradientDescent.lbfgs, halving),
+        (Regression, 'momentum', GradientDescent.momentum,
+         (0.0001, lambda lr: lr/2)),
+        (Regression, 'adam', lambda: GradientDescent.adam(size=32),
+         (0.01, lambda lr: lr/2)),
+        (Regression.LogisticRegression, 'batch',
+         lambda: GradientDescent.batch, 0.01),
+        (Regression.LogisticRegression, 'newton',
+         lambda: GradientDescent.newton(Regression.LogisticRegression),
+         halving),
+        (Regression.LogisticRegression, 'lbfgs', GradientDescent.lbfgs,
+         halving),
+        (Regression.LogisticRegression, 'momentum', GradientDescent.momentum,
+         (0.1, lambda lr: lr/2)),
+        (Regression.LogisticRegression, 'adam',
+         lambda: GradientDescent.adam(size=32), (0.01, lambda lr: lr/2))]
+    prev = None
+    for reg, name, make, lr in optimizers:
+        if reg is not prev:
+            print '== {} Optimizers =='.format(reg.__name__)
+            prev = reg
+        recorder = telemetry.Recorder()
+        weights = learn(make(), training, reg, lr, callback=recorder)
+        terror, roc, auc = evaluate(weights, testing, reg)
+        print INDENT * 1 + '{}: {} passes, Testing RMSE {}, AUC {}'.format(
+            name, len(recorder.passes()), terror, auc)
 
 
 ###############################################################################
@@ -1,10 +1,16 @@
 
 
+# third-party
+import numpy
+
+
 ###############################################################################
 
 
 class DataResult(object):
 
+    __slots__ = ('label', 'score', 'prediction')
+
     def __init__(self, label_value, learner_value, predicted_label=None):
         self.label = label_value # actual label
         self.score = learner_value # what the learner produced
@@ -29,21 +35,22 @@ def applyop(operating_point, results):
             for dr in results]
 
 
-def analyze(results):
-    '''Produce a confusion matrix and error-tables data for DataResults.'''
+def resultarrays(results):
+    '''Return arrays of the labels and of the scores of DataResults.'''
+    return (numpy.array([dr.label for dr in results]),
+            numpy.array([dr.score for dr in results], dtype=numpy.float64))
 
-    # initialize
-    cmet = {'tp':0.0,
-            'fn':0.0,
-            'fp':0.0,
-            'tn':0.0}
 
-    # categorize each result
-    for dr in results:
-        cmet['tp'] += dr.label == 1 and dr.prediction == 1
-        cmet['fn'] += dr.label == 1 and dr.prediction == 0
-        cmet['fp'] += dr.label == 0 and dr.prediction == 1
-        cmet['tn'] += dr.label == 0 and dr.prediction == 0
+def tabulate(tp, fn, fp, tn, count):
+    '''Produce error-tables data from confusion matrix counts.
+
+    The counts are either numbers or arrays of numbers (one per operating
+    point), and the rates are likewise.
+    '''
+    cmet = {'tp':tp,
+            'fn':fn,
+            'fp':fp,
+            'tn':tn}
 
     # false positive rate (false alarms)
     # fraction of negatives which are misclassified as positive
@@ -63,38 +70,137 @@ def analyze(results):
     # overall error rate (mistakes)
     # fraction of all data points which are misclassified
     # fraction of ALL emails which are someplace they aren't supposed to be
-    cmet['oer'] = (cmet['fp'] + cmet['fn']) / len(results)
+    cmet['oer'] = (cmet['fp'] + cmet['fn']) / count
     #
     return cmet
 
 
+def analyze(results):
+    '''Produce a confusion matrix and error-tables data for DataResults.'''
+    labels = numpy.array([dr.label for dr in results])
+    predictions = numpy.array([dr.prediction for dr in results])
+    positive, negative = labels == 1, labels == 0
+    predpositive, prednegative = predictions == 1, predictions == 0
+    return tabulate(float(numpy.count_nonzero(positive & predpositive)),
+                    float(numpy.count_nonzero(positive & prednegative)),
+                    float(numpy.count_nonzero(negative & predpositive)),
+                    float(numpy.count_nonzero(negative & prednegative)),
+                    len(results))
+
+
+def confusion(labels, scores, operating_points):
+    '''Produce analyze's confusion matrix and error-tables data straight from
+    arrays of labels and scores, without making any DataResults.
+
+    labels           -- array of labels, 1 or 0
+    scores           -- array of scores, one per label
+    operating_points -- number, or sequence of numbers to analyze at once
+
+    Given one operating point, the data is numbers as from analyze; given a
+    sequence of them, it is arrays with one entry per operating point, with
+    nan for rates which are undefined. The scores are sorted only once, so
+    each further operating point costs a binary search.
+
+    '''
+    labels = numpy.asarray(labels)
+    scores = numpy.asarray(scores, dtype=numpy.float64)
+    ops = numpy.asarray(operating_points, dtype=numpy.float64)
+    # predictions are + for scores above the operating point
+    posscores = numpy.sort(scores[labels == 1])
+    negscores = numpy.sort(scores[labels == 0])
+    fn = numpy.searchsorted(posscores, ops, side='right').astype(numpy.float64)
+    tn = numpy.searchsorted(negscores, ops, side='right').astype(numpy.float64)
+    tp = len(posscores) - fn
+    fp = len(negscores) - tn
+    if ops.ndim == 0:
+        return tabulate(float(tp), float(fn), float(fp), float(tn),
+                        len(labels))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return tabulate(tp, fn, fp, tn, len(labels))
+
+
+def sweep(results):
+    '''Generate the confusion counts at every distinct operating point.
+
+    The results are sorted by score once and swept from the lowest score up,
+    so the counts at each operating point come from running totals instead
+    of a fresh analysis. The first operating point is below every score, so
+    every prediction is +; after it, each distinct score is an operating
+    point, so on the final one every prediction is -.
+
+    Yields tuples of the operating point, the number of results with that
+    score (1 for the first), and the tp, fn, fp and tn counts.
+
+    '''
+    results = sorted(results, key=lambda dr: dr.score)
+    tp = float(sum(dr.label == 1 for dr in results))
+    fp = float(sum(dr.label == 0 for dr in results))
+    fn = tn = 0.0
+    yield results[0].score - 1, 1, tp, fn, fp, tn
+    # tied scores turn negative together
+    i = 0
+    while i < len(results):
+        j = i
+        while j < len(results) and results[j].score == results[i].score:
+            positive = results[j].label == 1
+            negative = results[j].label == 0
+            tp, fn = tp - positive, fn + positive
+            fp, tn = fp - negative, tn + negative
+            j += 1
+        yield results[i].score, j - i, tp, fn, fp, tn
+        i = j
+
+
+def mincostop(results, fpcost=1.0, fncost=1.0):
+    '''Return the operating point which minimizes the total cost of errors.
+
+    fpcost -- cost of each false positive (false alarm)
+    fncost -- cost of each false negative (missed spam)
+
+    '''
+    best = None
+    for op, ties, tp, fn, fp, tn in sweep(results):
+        cost = fpcost * fp + fncost * fn
+        if best is None or cost < best[1]:
+            best = op, cost
+    return best[0]
+
+
 def minerrop(results):
     '''Return the operating point which minimizes overall error.'''
-    op = 0.0
-    et = analyze(applyop(op, results))
-    direction = 0.1 * (1 if et['fpr'] > et['fnr'] else -1)
-    preverr = et['oer']
-    while True:
-        op += direction
-        et = analyze(applyop(op, results))
-        if et['oer'] > preverr:
-            return op - direction
+    return mincostop(results)
+
+
+def maxtprop(results, maxfpr):
+    '''Return the operating point with the highest true positive rate whose
+    false positive rate is at most maxfpr, or None if there is none.
+
+    Among operating points with the same true positive rate, the one with
+    the lowest false positive rate is chosen.
+    '''
+    # tp and fp only fall from one operating point to the next, so the first
+    # one within maxfpr has the highest tp
+    best = None
+    for op, ties, tp, fn, fp, tn in sweep(results):
+        if best is None:
+            if fp / (fp + tn) <= maxfpr:
+                best = op, tp
+        elif tp == best[1]:
+            best = op, tp
         else:
-            preverr = et['oer']
+            break
+    return None if best is None else best[0]
 
 
 def rocdata(results):
-    '''Return all (tp rate, fp rate) pairs accross all operating points.'''
-    results = results[:]
-    # sort data points by score
-    results.sort(key=lambda dr: dr.score)
-    # make first pair such that, for all dr, prediction is +
-    cmet = analyze(applyop(results[0].score - 1, results))
-    pairs = [(cmet['fpr'], cmet['tpr'])]
-    # make the rest such that on the final one, for all dr, prediction is -
-    for dr in results:
-        cmet = analyze(applyop(dr.score, results))
-        pairs.append((cmet['fpr'], cmet['tpr']))
+    '''Return all (fp rate, tp rate) pairs accross all operating points.
+
+    Every result's score is an operating point, as well as one below all of
+    them, so there is one more pair than there are results.
+    '''
+    pairs = []
+    for op, ties, tp, fn, fp, tn in sweep(results):
+        pairs.extend(ties * [(fp / (fp + tn), tp / (tp + fn))])
     return pairs
 
 
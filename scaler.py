@@ -0,0 +1,170 @@
+# third-party
+import numpy
+# local
+import dataset
+
+
+###############################################################################
+
+
+class Scaler(object):
+    '''Z-scores feature values with means and variances gathered in one pass.
+
+    width  -- number of feature values in each row
+    center -- whether transform subtracts the means; without it, features
+              are only divided by their standard deviations, which keeps
+              the zeros of sparse data zero
+
+    Rows are added a row or a chunk of rows at a time by update, and the
+    statistics of separately gathered Scalers (eg: from other chunks or
+    worker processes) are combined by merge, so the data never need be in
+    memory all at once or be read twice. Each chunk's own statistics are
+    combined with those so far by the pairwise update of Chan, Golub and
+    LeVeque, which for a single row is Welford's method; neither subtracts
+    large sums of squares, so both are numerically stable.
+
+    '''
+
+    def __init__(self, width, center=True):
+        self.center = center
+        self.count = 0 # rows so far
+        self.mean = numpy.zeros(width) # of each feature so far
+        self.m2 = numpy.zeros(width) # sum of squared deviations from mean
+
+    @property
+    def width(self):
+        '''Number of feature values in each row.'''
+        return len(self.mean)
+
+    @classmethod
+    def fit(cls, chunks, center=True):
+        '''Return a Scaler with the statistics of every row of a DataMatrix,
+        or of every chunk from an iterable of them (eg: dataset.iterfile).
+        '''
+        if hasattr(chunks, 'features'):
+            chunks = [chunks]
+        scaler = None
+        for chunk in chunks:
+            if scaler is None:
+                scaler = cls(chunk.width, center)
+            scaler.update(chunk.features)
+        return scaler
+
+    def update(self, features):
+        '''Add a row of features, or each row of a matrix of them, which may
+        be a dataset.SparseMatrix.
+        '''
+        if isinstance(features, dataset.SparseMatrix):
+            self.updatesparse(features)
+            return
+        features = numpy.asarray(features, dtype=numpy.float64)
+        if features.ndim == 1:
+            features = features[numpy.newaxis]
+        if len(features):
+            mean = features.mean(axis=0)
+            self.combine(len(features), mean,
+                         ((features - mean) ** 2).sum(axis=0))
+
+    def updatesparse(self, features):
+        '''Add each row of a dataset.SparseMatrix, looking only at its
+        nonzero values.
+
+        The zeros of each column all deviate from its mean by the mean, so
+        they add count times the mean squared to its sum of squares.
+
+        '''
+        count = len(features)
+        if not count:
+            return
+        mean = numpy.bincount(features.indices, weights=features.data,
+                              minlength=self.width) / count
+        nonzero = numpy.bincount(features.indices, minlength=self.width)
+        deviations = features.data - mean[features.indices]
+        m2 = numpy.bincount(features.indices, weights=deviations ** 2,
+                            minlength=self.width) + \
+             (count - nonzero) * mean ** 2
+        self.combine(count, mean, m2)
+
+    def merge(self, other):
+        '''Add the statistics of another Scaler of the same width.'''
+        self.combine(other.count, other.mean, other.m2)
+
+    def combine(self, count, mean, m2):
+        '''Add the statistics of count rows with the given means and sums of
+        squared deviations from them.
+        '''
+        if not count:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (count / float(total))
+        self.m2 = self.m2 + m2 + delta ** 2 * (self.count * count /
+                                               float(total))
+        self.count = total
+
+    def variance(self):
+        '''Return the unbiased variance of each feature, as stats.mvue.'''
+        return self.m2 / (self.count - 1)
+
+    def stddev(self):
+        '''Return the standard deviation of each feature, with 1 for
+        features which have not varied, so that they z-score to 0.
+        '''
+        if self.count < 2:
+            return numpy.ones(self.width)
+        sd = numpy.sqrt(self.variance())
+        sd[sd == 0] = 1.0
+        return sd
+
+    def transform(self, features):
+        '''Z-score a row of features, or each row of a matrix of them,
+        *IN PLACE*. Return the features.
+
+        A dataset.SparseMatrix can only be scaled, by a Scaler which does
+        not center; centering would make every zero nonzero.
+
+        '''
+        if isinstance(features, dataset.SparseMatrix):
+            if self.center:
+                raise ValueError('sparse features cannot be centered')
+            features.scale(1.0 / self.stddev())
+            return features
+        if self.center:
+            features -= self.mean
+        features /= self.stddev()
+        return features
+
+    def arrays(self, prefix='scaler'):
+        '''Return the statistics as a dict of named arrays, eg: for
+        checkpoint.save alongside other arrays.
+        '''
+        return {prefix + 'count':numpy.int64(self.count),
+                prefix + 'mean':self.mean,
+                prefix + 'm2':self.m2,
+                prefix + 'center':numpy.bool_(self.center)}
+
+    @classmethod
+    def fromarrays(cls, arrays, prefix='scaler'):
+        '''Return the Scaler whose arrays are among the named arrays, eg:
+        from checkpoint.load, or None if they are not. Arrays saved before
+        scalers could skip centering are of scalers which center.
+        '''
+        if prefix + 'mean' not in arrays:
+            return None
+        center = arrays.get(prefix + 'center', numpy.bool_(True)).item()
+        scaler = cls(len(arrays[prefix + 'mean']), center)
+        scaler.combine(arrays[prefix + 'count'].item(),
+                       arrays[prefix + 'mean'], arrays[prefix + 'm2'])
+        return scaler
+
+    def copy(self):
+        '''Return a new Scaler with the same statistics.'''
+        return self.fromarrays(self.arrays())
+
+    def __repr__(self):
+        return '{}({} features, {} rows{})'.format(
+            self.__class__.__name__, self.width, self.count,
+            '' if self.center else ', not centered')
+
+
+###############################################################################
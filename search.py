@@ -0,0 +1,233 @@
+# stdlib
+import itertools
+import multiprocessing
+import random
+# local
+import crossval
+import dataset
+import regression as rg
+import spambase
+import telemetry
+
+
+INDENT = '  '
+
+
+###############################################################################
+
+
+def tenth(lr):
+    '''Reduce a learning rate tenfold.'''
+    return lr / 10
+
+
+def grid(regressions, gdfunctions, learningrates, maxratios):
+    '''Return every (regression, gdfunction, learning rate, maximum error
+    ratio) candidate which can be made from the given choices.
+
+    learningrates -- list of learning rates as taken by regression.learn,
+                     eg: [0.1, (1.0, tenth)]
+
+    '''
+    return list(itertools.product(regressions, gdfunctions, learningrates,
+                                  maxratios))
+
+
+def sample(candidates, count, seed=rg.RANDOMSEED):
+    '''Return count candidates chosen at random, the same way each time.'''
+    return random.Random(seed).sample(candidates, min(count, len(candidates)))
+
+
+def candidatename(candidate):
+    '''Name a (regression, gdfunction, learning rate, ratio) candidate.'''
+    regression, gdfunction, learningrate, maxratio = candidate
+    return '{}_ratio={}'.format(
+        crossval.learnername((regression, gdfunction, learningrate)), maxratio)
+
+
+###############################################################################
+
+
+# set in each worker process by initworker
+workertraining = None
+workercandidates = None
+
+
+def initworker(training, candidates):
+    '''Give a worker process the data to train on.'''
+    global workertraining, workercandidates
+    workertraining = training
+    workercandidates = candidates
+
+
+def runcandidate(task):
+    '''Train one candidate for up to budget more accepted passes in a worker
+    process.
+
+    task -- tuple of the candidate's index, then its weights, training error
+            and learning rate so far (all None to start from scratch), the
+            state of its gdfunction's rng (None if it has none), then the
+            budget
+
+    Return a tuple of the index, the new weights, error and learning rate,
+    the new rng state, whether learning finished, how many passes were made
+    and how many of them were accepted.
+
+    Candidates may share a gdfunction, and each worker has its own copy of
+    it, so a gdfunction with an rng (eg: a shuffling minibatch) is given the
+    candidate's own random state for the task, as loop does when it resumes
+    from a checkpoint. Its shuffles then do not depend on which worker runs
+    which task.
+
+    '''
+    i, weights, error, learningrate, rngstate, budget = task
+    regression, gdfunction, initial, maxratio = workercandidates[i]
+    initiallr, reducelr, suffix = rg.learningrates(initial)
+    if weights is None:
+        weights = workertraining.width * [0.0]
+        learningrate = initiallr
+    rng = getattr(gdfunction, 'rng', None)
+    if rng is not None:
+        rng.setstate(rngstate)
+    # the printed training events of many workers would interleave badly, so
+    # just record them
+    recorder = telemetry.Recorder()
+    accepted = 0
+    finished = False
+    for weights, error, learningrate, finished in rg.GradientDescent.passes(
+            weights, workertraining, regression.model, regression.gradient,
+            learningrate, reducelr, gdfunction, maxratio, error, recorder):
+        accepted = sum(e['accepted'] for e in recorder.passes())
+        if finished or accepted >= budget:
+            break
+    if rng is not None:
+        rngstate = rng.getstate()
+    return (i, weights, error, learningrate, rngstate, finished,
+            len(recorder.passes()), accepted)
+
+
+###############################################################################
+
+
+class Trial(object):
+    '''How far a candidate got in a search.'''
+
+    def __init__(self, candidate):
+        self.candidate = candidate
+        self.weights = None # accepted so far
+        self.error = None # training RMSE of the weights
+        self.learningrate = None # for the next pass
+        rng = getattr(candidate[1], 'rng', None)
+        self.rngstate = None if rng is None else rng.getstate()
+        self.passes = 0 # made so far, accepted or not
+        self.accepted = 0 # passes accepted so far
+        self.status = 'running' # or 'finished' or 'pruned'
+
+    def __str__(self):
+        return '{}: RMSE {} after {} passes ({} accepted), {}'.format(
+            candidatename(self.candidate), self.error, self.passes,
+            self.accepted, self.status)
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__,
+                               candidatename(self.candidate))
+
+
+def halving(training, candidates, budget=1, eta=3, processes=None):
+    '''Search candidates by successive halving. Return a list of Trials.
+
+    training   -- DataMatrix, already preprocessed
+    candidates -- list of (regression, gdfunction, learning rate, maximum
+                  error ratio) tuples, eg: from grid or sample
+    budget     -- accepted passes each candidate makes in the first round
+    eta        -- each round keeps the best 1/eta of the running candidates
+                  and gives them eta times the passes of the last round
+    processes  -- number of worker processes; defaults to the cpu count
+
+    All running candidates train concurrently in a pool of processes which
+    share the training data. After each round those with the worst training
+    RMSE so far are dropped, until the one left runs until it finishes.
+
+    Only accepted passes count toward a budget. A rejected pass just lowers
+    the learning rate, so a candidate whose learning rate starts too high
+    is not judged by its initial error before it has had a chance to
+    improve on it. Each candidate's gdfunction rng (see runcandidate)
+    starts from the state it has when the search begins, as a fresh
+    gdfunction with the same seed would, and carries on between rounds.
+
+    '''
+    shared = dataset.DataMatrix(crossval.share(training.features),
+                                crossval.share(training.labels))
+    trials = [Trial(c) for c in candidates]
+    running = range(len(trials))
+    pool = multiprocessing.Pool(processes, initworker, (shared, candidates))
+    try:
+        while running:
+            # train every running candidate for the round's budget
+            tasks = [(i, trials[i].weights, trials[i].error,
+                      trials[i].learningrate, trials[i].rngstate, budget) \
+                     for i in running]
+            for i, weights, error, learningrate, rngstate, finished, count, \
+                    accepted in pool.imap_unordered(runcandidate, tasks):
+                t = trials[i]
+                t.weights, t.error = weights, error
+                t.learningrate, t.rngstate = learningrate, rngstate
+                t.passes += count
+                t.accepted += accepted
+                if finished:
+                    t.status = 'finished'
+            # keep the best of those still running
+            running = [i for i in running if trials[i].status == 'running']
+            running.sort(key=lambda i: trials[i].error)
+            for i in running[max(1, len(running) // eta):]:
+                trials[i].status = 'pruned'
+            running = running[:max(1, len(running) // eta)]
+            print INDENT + 'Round of {} passes; {} candidates left'.format(
+                budget, len(running))
+            budget *= eta
+    finally:
+        pool.terminate()
+        pool.join()
+    return trials
+
+
+###############################################################################
+
+
+if __name__ == '__main__':
+    print
+
+    # load from file
+    spambase.load()
+    d = spambase.data
+    rg.preprocess(d)
+
+    # hold out the first fold for testing the winner
+    testing, training = rg.holdout(rg.folds(len(d)), 0)
+    testing = d[testing]
+    training = d[training]
+
+    # search a sample of the grid
+    candidates = sample(grid(
+        [rg.Regression, rg.Regression.LogisticRegression],
+        [rg.GradientDescent.stochastic_pass,
+         rg.GradientDescent.batch,
+         rg.GradientDescent.minibatch(64, True, rg.RANDOMSEED)],
+        [r for lr in (1.0, 0.1, 0.01, 0.001, 0.0001)
+         for r in (lr, (lr, tenth))],
+        [0.99, 0.999]), 40)
+    print 'Candidates:', len(candidates)
+    trials = halving(training, candidates)
+
+    # report
+    trials.sort(key=lambda t: t.error)
+    for t in trials:
+        print INDENT + str(t)
+    best = trials[0]
+    terror, roc, auc = rg.evaluate(best.weights, testing, best.candidate[0])
+    print '== Best: {} =='.format(candidatename(best.candidate))
+    print INDENT + 'Testing RMSE:', terror
+    print INDENT + 'AUC:', auc
+
+
+###############################################################################
@@ -1,19 +1,49 @@
 # stdlib
-from math import e
+import math
+# third-party
+import numpy
+
+
+###############################################################################
+#
+# The kernels take lists or NumPy arrays of numbers. A list is converted to
+# an array once, and everything after that is done by NumPy, so no list of
+# intermediate values is ever built. Sums of squares are dot products, which
+# make no array of the squares either. Functions which reduce to a single
+# number return a float.
+#
+###############################################################################
+
+
+def floats(lon):
+    '''Return a list or array of numbers as an array of floats. An array of
+    floats is returned as is, not copied.
+    [number] --> array
+    '''
+    return numpy.asarray(lon, dtype=numpy.float64)
+
+
+def sumsquares(a):
+    '''Calculate the sum of the squares of an array of numbers.
+    array --> float
+    '''
+    a = floats(a).ravel()
+    return float(a.dot(a))
 
 
 def mean(lon):
     '''Calculate the mean of a list of numbers.
     [number] --> float
     '''
-    return sum(lon) / float(len(lon))
+    return float(numpy.mean(floats(lon)))
 
 
 def mvue(lon, mu):
     '''Calculate the variance of a list of numbers given the mean.
     [number] number --> float
     '''
-    return sum([(n - mu) ** 2 for n in lon]) / float(len(lon) - 1)
+    lon = floats(lon)
+    return sumsquares(lon - mu) / float(len(lon) - 1)
 
 
 def stddev(var):
@@ -25,28 +55,48 @@ def zscore(lon, mu, sd):
     '''Calculate the z-scores of a list of numbers given the mean and std dev.
     [number] number number --> [float]
     '''
-    return [(n - mu) / float(sd) for n in lon]
+    return ((floats(lon) - mu) / float(sd)).tolist()
 
 
 def dotprod(lona, lonb):
     '''Calculate the dot product between two lists of numbers.
     [number] [number] -> number
     '''
-    return sum([a * b for a, b in zip(lona, lonb)])
+    return float(numpy.dot(floats(lona), floats(lonb)))
 
 
 def logistic(x):
     '''Maps the real numbers to the range [0, 1] placing 0 at 1/2.
-    number --> float
+    number --> float, or array --> array
+
+    Never overflows: for negative x it is computed as e^x / (1 + e^x), so
+    the exponent is never positive.
+    '''
+    if not isinstance(x, numpy.ndarray):
+        z = math.exp(-abs(x))
+        return 1 / (1 + z) if x >= 0 else z / (1 + z)
+    z = numpy.exp(-numpy.abs(x))
+    return numpy.where(x >= 0, 1 / (1 + z), z / (1 + z))
+
+
+def logloss(lox, lol):
+    '''Calculate the mean log-loss of logistic regression given the
+    regression's values before the logistic function and the 0/1 labels.
+    [number] [number] --> float
+
+    Computed as log(1 + e^x) - label * x, with log(1 + e^x) from
+    numpy.logaddexp, so it never overflows even where the logistic of x
+    rounds to 0 or 1.
     '''
-    return 1 / (1 + (e ** -x))
+    lox = floats(lox)
+    return float(numpy.mean(numpy.logaddexp(0, lox) - floats(lol) * lox))
 
 
 def sse(lona, lonb):
     '''Calculate the sum squared error between two lists of numbers.
     [number] [number] --> number
     '''
-    return sum([(a - b) ** 2 for a, b in zip(lona, lonb)])
+    return sumsquares(floats(lona) - floats(lonb))
 
 
 def rmse(lona, lonb):
@@ -0,0 +1,120 @@
+# stdlib
+import json
+import time
+
+
+###############################################################################
+#
+# The gradient descent loops report what they do by calling a callback with
+# one event at a time. An event is a dict whose 'event' key is one of:
+#
+#   start   -- learningrate
+#   initial -- error, errortime, rows
+#   resume  -- checkpoint (a description of it)
+#   pass    -- pass, learningrate, error (None on overflow), accepted,
+#              gradienttime, errortime, rows, rowspersec
+#   retry   -- pass, learningrate (the reduced one)
+#   finish  -- pass, reason ('ratio' or 'learningrate'), and either ratio and
+#              maxratio or learningrate
+#
+# Times are in seconds. The callbacks below print, record and write events,
+# and tee sends each event to several of them.
+#
+###############################################################################
+
+
+def printer(indent='  '):
+    '''Generate a callback which prints training events as lines like
+    "Training RMSE: v 0.31".
+    '''
+    def fn(event):
+        kind = event['event']
+        if kind == 'start':
+            print indent * 2 + 'Initial learning rate:', event['learningrate']
+        elif kind == 'initial':
+            print indent * 2 + 'Initial Training RMSE:', event['error']
+        elif kind == 'resume':
+            print indent * 2 + 'Resuming from:', event['checkpoint']
+        elif kind == 'pass':
+            if event['error'] is None:
+                print indent * 3 + 'Training RMSE: Overflow'
+            elif event['accepted']:
+                print indent * 2 + 'Training RMSE: v', event['error']
+            else:
+                print indent * 3 + 'Training RMSE: ^', event['error']
+        elif kind == 'retry':
+            print indent * 3 + 'Retrying with learning rate:', \
+                  event['learningrate']
+        elif kind == 'finish':
+            if event['reason'] == 'ratio':
+                print indent * 2 + 'Finished learning; error ratio:',
+                print event['ratio'], '>', event['maxratio']
+            else:
+                print indent * 2 + 'Finished learning; learning rate',
+                print 'cannot be reduced:', event['learningrate']
+    return fn
+
+
+def jsonlines(fd):
+    '''Generate a callback which writes each training event to an open file
+    as one line of JSON, adding the wall clock time under 'time'.
+    '''
+    def fn(event):
+        event = dict(event, time=time.time())
+        fd.write(json.dumps(event, sort_keys=True) + '\n')
+        fd.flush()
+    return fn
+
+
+def tee(*callbacks):
+    '''Generate a callback which passes each training event to all of the
+    given callbacks in turn.
+    '''
+    def fn(event):
+        for callback in callbacks:
+            callback(event)
+    return fn
+
+
+def ticker(pr):
+    '''Generate a callback which advances a progress.Progress by one item for
+    every training pass, eg: to show a bar of passes against a budget.
+    '''
+    def fn(event):
+        if event['event'] == 'pass':
+            pr.next()
+    return fn
+
+
+def quiet(event):
+    '''A callback which ignores training events.'''
+    pass
+
+
+class Recorder(object):
+    '''A callback which keeps every training event in memory.'''
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def passes(self):
+        '''Return the pass events.'''
+        return [e for e in self.events if e['event'] == 'pass']
+
+    def errors(self):
+        '''Return the training RMSE after each pass (None on overflow).'''
+        return [e['error'] for e in self.passes()]
+
+    def total(self, key):
+        '''Return the sum of a timing (eg: 'gradienttime') over all passes.'''
+        return sum(e[key] for e in self.passes())
+
+    def __repr__(self):
+        return '{}({} events)'.format(self.__class__.__name__,
+                                      len(self.events))
+
+
+###############################################################################